@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi_zero.settings import Settings
+
+# the production argon2 costs, read when fastapi_zero.security builds its
+# hasher; the benchmark measures what a deployment pays per login
+for _name in ('ARGON2_TIME_COST', 'ARGON2_MEMORY_COST', 'ARGON2_PARALLELISM'):
+    os.environ.setdefault(_name, str(Settings.model_fields[_name].default))
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from fastapi_zero import admission  # noqa: E402
+from fastapi_zero.app import app  # noqa: E402
+from fastapi_zero.models import User, table_registry  # noqa: E402
+from fastapi_zero.security import get_password_hash  # noqa: E402
+from tests.factories import UserFactory  # noqa: E402
+
+PASSWORD = 'benchmark'
+SEED_BATCH_SIZE = 5000
+
+
+@dataclass
+class Workload:
+    # users holds the signed-in accounts, seeded the size of the users table
+    users: list[dict]
+    seeded: int
+    rng: random.Random
+
+
+async def seed_database(url: str, users: int):
+    engine = create_async_engine(url)
+    # one real argon2 hash shared by every row keeps seeding I/O bound
+    password = get_password_hash(PASSWORD)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.drop_all)
+        await conn.run_sync(table_registry.metadata.create_all)
+
+        for start in range(0, users, SEED_BATCH_SIZE):
+            rows = [
+                {
+                    'username': user.username,
+                    'email': user.email,
+                    'password': password,
+                }
+                for user in UserFactory.build_batch(
+                    min(SEED_BATCH_SIZE, users - start)
+                )
+            ]
+            await conn.execute(insert(User), rows)
+
+    await engine.dispose()
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'rps': (len(latencies) + errors) / elapsed,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else 0,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else 0,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else 0,
+    }
+
+
+async def _login(client: httpx.AsyncClient, user: dict) -> httpx.Response:
+    return await client.post(
+        '/auth/token', data={'username': user['email'], 'password': PASSWORD}
+    )
+
+
+async def _auth_token(client, workload, user):
+    return await _login(client, user)
+
+
+def _list_users(limit: int):
+    async def scenario(client, workload, user):
+        # anywhere in the seeded table, so deep offsets are measured too
+        offset = workload.rng.randrange(max(1, workload.seeded - limit + 1))
+        return await client.get(
+            f'/users/?offset={offset}&limit={limit}', headers=user['headers']
+        )
+
+    return scenario
+
+
+async def _read_user(client, workload, user):
+    return await client.get(
+        f'/users/{workload.rng.choice(workload.users)["id"]}'
+    )
+
+
+async def _update_user(client, workload, user):
+    return await client.put(
+        f'/users/{user["id"]}',
+        headers=user['headers'],
+        json={
+            'username': user['username'],
+            'email': user['email'],
+            'password': PASSWORD,
+        },
+    )
+
+
+SCENARIOS = {
+    'auth_token': _auth_token,
+    'list_users': _list_users(10),
+    'list_users_1k': _list_users(1_000),
+    'list_users_10k': _list_users(10_000),
+    'read_user': _read_user,
+    'update_user': _update_user,
+}
+
+
+async def run_endpoint(
+    client: httpx.AsyncClient,
+    name: str,
+    workload: Workload,
+    requests: int,
+    concurrency: int,
+) -> dict:
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            user = workload.rng.choice(workload.users)
+            started_at = time.perf_counter()
+            response = await scenario(client, workload, user)
+            if response.is_success:
+                latencies.append(time.perf_counter() - started_at)
+            else:
+                errors += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started_at)
+
+
+async def _sign_in(
+    client: httpx.AsyncClient, users: int, count: int, rng: random.Random
+):
+    signed_in = []
+
+    for user_id in rng.sample(range(1, users + 1), min(count, users)):
+        response = await client.get(f'/users/{user_id}')
+        user = {**response.json(), 'id': user_id}
+        token = (await _login(client, user)).json()['access_token']
+        user['headers'] = {'Authorization': f'Bearer {token}'}
+        signed_in.append(user)
+
+    return signed_in
+
+
+async def run_benchmark(args) -> dict:
+    url = f'sqlite+aiosqlite:///{args.database}'
+    await seed_database(url, args.users)
+    # the lifespan reads Settings when it starts, so this picks the seed db
+    os.environ['DATABASE_URL'] = url
+    # every simulated user shares one client address
+    admission.client_buckets.rate = 0
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(
+            transport=transport, base_url='http://benchmark'
+        ) as client,
+    ):
+        rng = random.Random(args.seed)
+        workload = Workload(
+            users=await _sign_in(client, args.users, args.accounts, rng),
+            seeded=args.users,
+            rng=rng,
+        )
+        for name in args.endpoints:
+            results[name] = await run_endpoint(
+                client, name, workload, args.requests, args.concurrency
+            )
+
+    return {
+        'meta': {
+            'users': args.users,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'python': sys.version.split()[0],
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    regressions = []
+
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+
+        if after['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(
+                f'{name}: p95 {before["p95_ms"]:.2f}ms -> '
+                f'{after["p95_ms"]:.2f}ms'
+            )
+        if after['rps'] < before['rps'] * (1 - threshold):
+            regressions.append(
+                f'{name}: rps {before["rps"]:.1f} -> {after["rps"]:.1f}'
+            )
+
+    return regressions
+
+
+def _print_results(report: dict):
+    print(f'{"endpoint":<16} {"rps":>9} {"p50":>9} {"p95":>9} {"p99":>9}')
+    for name, result in report['results'].items():
+        print(
+            f'{name:<16} {result["rps"]:>9.1f} {result["p50_ms"]:>7.2f}ms '
+            f'{result["p95_ms"]:>7.2f}ms {result["p99_ms"]:>7.2f}ms'
+        )
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Endpoint load benchmark')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run')
+    run.add_argument('--users', type=int, default=10_000)
+    run.add_argument('--requests', type=int, default=500)
+    run.add_argument('--concurrency', type=int, default=16)
+    run.add_argument('--accounts', type=int, default=20)
+    # the same seed replays the same accounts, ids and offsets
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument(
+        '--endpoints', nargs='+', choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    run.add_argument('--database')
+    run.add_argument('--output', type=Path)
+
+    check = commands.add_parser('compare')
+    check.add_argument('baseline', type=Path)
+    check.add_argument('current', type=Path)
+    check.add_argument('--threshold', type=float, default=0.10)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+
+    if args.command == 'compare':
+        regressions = compare(
+            json.loads(args.baseline.read_text()),
+            json.loads(args.current.read_text()),
+            args.threshold,
+        )
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args.database = args.database or f'{tmp}/benchmark.db'
+        report = asyncio.run(run_benchmark(args))
+
+    _print_results(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
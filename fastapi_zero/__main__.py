@@ -0,0 +1,20 @@
+import uvicorn
+
+from fastapi_zero.settings import Settings
+
+
+def main():
+    settings = Settings()
+
+    # uvicorn spawns fresh worker processes that import the app and run its
+    # lifespan on their own, so no engine or pool crosses a fork
+    uvicorn.run(
+        'fastapi_zero.app:app',
+        host=settings.WEB_HOST,
+        port=settings.WEB_PORT,
+        workers=settings.WEB_WORKERS,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+import math
+import time
+from collections import deque
+from http import HTTPStatus
+
+from fastapi import HTTPException, Request
+
+from fastapi_zero.cache import TTLCache
+from fastapi_zero.metrics import REGISTRY, Counter, Gauge
+from fastapi_zero.settings import Settings
+
+settings = Settings()
+
+
+class Overloaded(Exception):  # noqa: N818
+    def __init__(self, retry_after: float):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            raise Overloaded(self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await self._wait(waiter)
+        except TimeoutError:
+            raise Overloaded(self.queue_timeout)
+
+    async def _wait(self, waiter: asyncio.Future):
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over as we gave up, pass it on
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        # the slot passes straight to the oldest waiter, so active stays put
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def clear(self):
+        for waiter in self._waiters:
+            waiter.cancel()
+        self._waiters.clear()
+        self.active = 0
+
+
+class ClientBuckets:
+    def __init__(self, rate: float, burst: int, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        # an entry that expired belongs to a bucket that is full again
+        self._buckets = TTLCache(
+            maxsize=max_clients, ttl=burst / rate if rate else math.inf
+        )
+
+    def consume(self, client: str, cost: int = 1) -> float:
+        if self.rate <= 0 or cost <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        if tokens < cost:
+            self._buckets.set(client, (tokens, now))
+            return (cost - tokens) / self.rate
+
+        self._buckets.set(client, (tokens - cost, now))
+        return 0.0
+
+    def clear(self):
+        self._buckets.clear()
+
+
+hash_limiter = AdmissionLimiter(
+    settings.ADMISSION_MAX_CONCURRENCY,
+    settings.ADMISSION_QUEUE_SIZE,
+    settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
+client_buckets = ClientBuckets(
+    settings.RATE_LIMIT_PER_SECOND,
+    settings.RATE_LIMIT_BURST,
+    settings.RATE_LIMIT_MAX_CLIENTS,
+)
+
+requests_shed = REGISTRY.register(
+    Counter(
+        'admission_requests_shed_total',
+        'Requests rejected before running argon2.',
+        ('route', 'reason'),
+    )
+)
+REGISTRY.register(
+    Gauge(
+        'admission_in_flight',
+        'Requests holding a hash-bound admission slot.',
+        function=lambda: hash_limiter.active,
+    )
+)
+REGISTRY.register(
+    Gauge(
+        'admission_queued',
+        'Requests waiting for a hash-bound admission slot.',
+        function=lambda: hash_limiter.queued,
+    )
+)
+
+
+def _shed(request: Request, status: HTTPStatus, reason: str, retry_after):
+    route = getattr(request.scope.get('route'), 'path', 'unmatched')
+    requests_shed.inc((route, reason))
+
+    return HTTPException(
+        status_code=status,
+        detail='Too many requests'
+        if status == HTTPStatus.TOO_MANY_REQUESTS
+        else 'Server is busy',
+        headers={'Retry-After': str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def charge_hashes(request: Request, count: int):
+    # for routes that hash more than once per request: each hash costs a
+    # token, so a bulk import cannot slip past the client's rate
+    client = request.client.host if request.client else 'unknown'
+    retry_after = client_buckets.consume(client, count)
+    if retry_after:
+        raise _shed(
+            request, HTTPStatus.TOO_MANY_REQUESTS, 'rate_limit', retry_after
+        )
+
+
+async def admit_hash_request(request: Request):
+    charge_hashes(request, 1)
+
+    try:
+        await hash_limiter.acquire()
+    except Overloaded as exc:
+        raise _shed(
+            request,
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            'overloaded',
+            exc.retry_after,
+        )
+
+    try:
+        yield
+    finally:
+        hash_limiter.release()
@@ -1,12 +1,71 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from http import HTTPStatus
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
-from fastapi_zero.routers import auth, users
+from fastapi_zero import database
+from fastapi_zero.deadline import DeadlineMiddleware
+from fastapi_zero.metrics import REGISTRY, MetricsMiddleware
+from fastapi_zero.profiling import ProfilerMiddleware
+from fastapi_zero.revocation import (
+    load_revocations,
+    run_revocation_sync,
+    run_token_purge,
+)
+from fastapi_zero.routers import admin, auth, users
 from fastapi_zero.schemas import Message
+from fastapi_zero.security import (
+    get_hash_executor,
+    get_password_hash_async,
+    shutdown_hash_executor,
+)
+from fastapi_zero.settings import Settings
 
-app = FastAPI(title='API DO ENZO!')
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # everything that owns sockets, threads or processes is created here,
+    # once per worker, never at import time before a fork
+    settings = Settings()
+    database.init_database(settings)
+    get_hash_executor()
+    revocation_sync = None
+    token_purge = None
+
+    try:
+        await database.warmup_database(settings.DB_WARMUP_CONNECTIONS)
+        await get_password_hash_async('warmup')
+        await load_revocations(database.engine)
+        if settings.REVOCATION_SYNC_SECONDS > 0:
+            revocation_sync = asyncio.create_task(
+                run_revocation_sync(
+                    database.reader_engine, settings.REVOCATION_SYNC_SECONDS
+                )
+            )
+        if settings.TOKEN_PURGE_SECONDS > 0:
+            token_purge = asyncio.create_task(
+                run_token_purge(database.engine, settings.TOKEN_PURGE_SECONDS)
+            )
+        yield
+    finally:
+        for task in (revocation_sync, token_purge):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        await database.dispose_database()
+        shutdown_hash_executor()
+
+
+app = FastAPI(title='API DO ENZO!', lifespan=lifespan)
+# added first so it runs inside the metrics middleware, which then sees 504s
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware)
+
+app.include_router(admin.router)
 app.include_router(auth.router)
 app.include_router(users.router)
 
@@ -14,3 +73,10 @@ app.include_router(users.router)
 @app.post('/', status_code=HTTPStatus.OK, response_model=Message)
 async def read_root(texto: Message):
     return Message(message=texto.message)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def read_metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type='text/plain; version=0.0.4'
+    )
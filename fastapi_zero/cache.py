@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class Generations:
+    # a counter per key, bumped on every invalidation; a reader compares it
+    # before and after a fetch to tell whether what it read is still current
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._counts: OrderedDict[Hashable, int] = OrderedDict()
+
+    def get(self, key: Hashable) -> int:
+        return self._counts.get(key, 0)
+
+    def bump(self, key: Hashable):
+        self._counts[key] = self._counts.pop(key, 0) + 1
+        while len(self._counts) > self.maxsize:
+            self._counts.popitem(last=False)
+
+    def clear(self):
+        self._counts.clear()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        # bumped by pop, so a reader that fetched a value before the
+        # invalidation can tell and not store it
+        self._generations = Generations(maxsize)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        item = self._data.get(key)
+
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def generation(self, key: Hashable) -> int:
+        return self._generations.get(key)
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None):
+        if self.maxsize <= 0:
+            return
+        if generation is not None and generation != self.generation(key):
+            return
+
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._generations.bump(key)
+
+        return self._data.pop(key, (None, None))[1]
+
+    def clear(self):
+        self._data.clear()
+        self._generations.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,101 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from pwdlib.hashers.argon2 import Argon2Hasher
+
+MAX_TIME_COST = 10
+MIN_MEMORY_COST = 8 * 1024
+
+
+def measure(
+    time_cost: int, memory_cost: int, parallelism: int, rounds: int = 5
+) -> float:
+    hasher = Argon2Hasher(
+        time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+    )
+    samples = []
+
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        hasher.hash('calibration')
+        samples.append(time.perf_counter() - started_at)
+
+    return statistics.median(samples)
+
+
+def calibrate(
+    target_seconds: float,
+    max_memory_cost: int,
+    parallelism: int,
+    measure=measure,
+) -> dict:
+    # memory hardness is what hurts attackers most, so keep as much memory
+    # as the budget allows and only then spend the rest on passes
+    memory_cost = max_memory_cost
+    while (
+        memory_cost > MIN_MEMORY_COST
+        and measure(1, memory_cost, parallelism) > target_seconds
+    ):
+        memory_cost //= 2
+
+    time_cost = 1
+    while time_cost < MAX_TIME_COST:
+        if measure(time_cost + 1, memory_cost, parallelism) > target_seconds:
+            break
+        time_cost += 1
+
+    return {
+        'ARGON2_TIME_COST': time_cost,
+        'ARGON2_MEMORY_COST': memory_cost,
+        'ARGON2_PARALLELISM': parallelism,
+        'seconds': measure(time_cost, memory_cost, parallelism),
+    }
+
+
+def write_env(path: Path, values: dict):
+    lines = (
+        path.read_text(encoding='utf-8').splitlines() if path.exists() else []
+    )
+    lines = [
+        line for line in lines if line.partition('=')[0].strip() not in values
+    ]
+    lines.extend(f'{name}={value}' for name, value in values.items())
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Pick argon2 costs that hash in about --target-ms here'
+    )
+    parser.add_argument('--target-ms', type=float, default=250)
+    parser.add_argument('--max-memory-mib', type=int, default=64)
+    parser.add_argument(
+        '--parallelism', type=int, default=min(4, os.cpu_count() or 1)
+    )
+    parser.add_argument('--write', type=Path, metavar='ENV_FILE')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    result = calibrate(
+        args.target_ms / 1000, args.max_memory_mib * 1024, args.parallelism
+    )
+    seconds = result.pop('seconds')
+
+    for name, value in result.items():
+        print(f'{name}={value}')
+    print(f'# {seconds * 1000:.1f}ms per hash', file=sys.stderr)
+
+    if args.write:
+        write_env(args.write, result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,186 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+import logging
 
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+
+from fastapi_zero.deadline import enforce_deadlines
+from fastapi_zero.group_commit import GroupCommitWriter
+from fastapi_zero.metrics import instrument_engine
+from fastapi_zero.models import User
+from fastapi_zero.profiling import annotate_engine, profiling_enabled
 from fastapi_zero.settings import Settings
+from fastapi_zero.slow_queries import slow_queries
+
+logger = logging.getLogger(__name__)
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in {
+        None,
+        '',
+        ':memory:',
+    }
+
+
+def _sqlite_pragmas(settings: Settings, readonly: bool) -> list[str]:
+    pragmas = [
+        f'PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}',
+        f'PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}',
+        f'PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}',
+        # off by default in SQLite, without it no ON DELETE CASCADE runs
+        'PRAGMA foreign_keys=ON',
+    ]
+
+    if readonly:
+        pragmas.append('PRAGMA query_only=ON')
+    else:
+        pragmas += [
+            f'PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}',
+            f'PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}',
+        ]
+
+    return pragmas
+
+
+def create_database_engine(
+    settings: Settings, readonly: bool = False
+) -> AsyncEngine:
+    options = {}
+
+    if not _is_sqlite_memory(settings.DATABASE_URL):
+        if readonly:
+            pool_size = settings.DB_READER_POOL_SIZE
+            max_overflow = settings.DB_READER_MAX_OVERFLOW
+        else:
+            # the group-commit writer pins one connection for itself
+            pool_size = settings.DB_WRITER_POOL_SIZE + int(
+                settings.GROUP_COMMIT_ENABLED
+            )
+            max_overflow = settings.DB_WRITER_MAX_OVERFLOW
+        options = {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': settings.DB_POOL_TIMEOUT_SECONDS,
+        }
+
+    engine = create_async_engine(settings.DATABASE_URL, **options)
+    instrument_engine(engine)
+    enforce_deadlines(engine)
+    if profiling_enabled():
+        annotate_engine(engine)
+    if slow_queries.threshold_ms > 0:
+        slow_queries.attach(
+            engine, explain=not _is_sqlite_memory(settings.DATABASE_URL)
+        )
+
+    if engine.dialect.name == 'sqlite':
+        pragmas = _sqlite_pragmas(settings, readonly)
+
+        @event.listens_for(engine.sync_engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return engine
+
+
+engine: AsyncEngine | None = None
+reader_engine: AsyncEngine | None = None
+group_commit_writer: GroupCommitWriter | None = None
 
-engine = create_async_engine(Settings().DATABASE_URL)
+# built exactly like fetch_user_row and read_users build theirs, anything
+# else compiles to a different cache key and warms nothing
+HOT_STATEMENTS = (
+    select(User.__table__).where(User.email == 'warmup@example.com'),
+    select(User.__table__).where(User.id == 0),
+    select(User.username, User.email, User.id, User.updated_at)
+    .order_by(User.id)
+    .limit(1)
+    .offset(0),
+    select(User.username, User.email, User.id, User.updated_at)
+    .order_by(User.id)
+    .limit(1)
+    .where(User.id > 0),
+)
+
+
+def init_database(settings: Settings):
+    global engine, reader_engine, group_commit_writer  # noqa: PLW0603
+
+    engine = create_database_engine(settings)
+    # an in-memory database only exists on its own connection, so reads and
+    # writes have to share it
+    reader_engine = (
+        engine
+        if _is_sqlite_memory(settings.DATABASE_URL)
+        else create_database_engine(settings, readonly=True)
+    )
+    group_commit_writer = (
+        GroupCommitWriter(
+            engine,
+            window_seconds=settings.GROUP_COMMIT_WINDOW_MS / 1000,
+            max_batch=settings.GROUP_COMMIT_MAX_BATCH,
+        )
+        if settings.GROUP_COMMIT_ENABLED
+        else None
+    )
+
+
+async def _warmup_connection(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        for statement in HOT_STATEMENTS:
+            try:
+                # fills the engine's compiled cache for the hot paths
+                await conn.execute(statement)
+            except DBAPIError:
+                logger.warning('Skipping warmup, users table is missing')
+                return
+
+
+async def warmup_database(connections: int):
+    if connections <= 0:
+        return
+
+    # open the connections concurrently so the pool really holds N of them
+    await asyncio.gather(
+        _warmup_connection(engine),
+        *(_warmup_connection(reader_engine) for _ in range(connections)),
+    )
+
+
+async def dispose_database():
+    global engine, reader_engine, group_commit_writer  # noqa: PLW0603
+
+    if group_commit_writer is not None:
+        await group_commit_writer.stop()
+    await slow_queries.dispose()
+    if reader_engine is not None and reader_engine is not engine:
+        await reader_engine.dispose()
+    if engine is not None:
+        await engine.dispose()
+
+    engine = reader_engine = group_commit_writer = None
 
 
 async def get_session():
     async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
+
+
+async def get_read_session():
+    async with AsyncSession(reader_engine, expire_on_commit=False) as session:
+        yield session
+
+
+def get_group_commit_writer():
+    return group_commit_writer
@@ -0,0 +1,160 @@
+import asyncio
+import json
+from contextvars import ContextVar
+from http import HTTPStatus
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import compile_path
+
+from fastapi_zero.settings import Settings
+
+TIMEOUT_HEADER = b'x-request-timeout'
+
+settings = Settings()
+# route templates such as /users/{user_id} work as keys too
+ROUTE_TIMEOUTS = [
+    (compile_path(path)[0], timeout)
+    for path, timeout in settings.REQUEST_ROUTE_TIMEOUTS.items()
+]
+
+# absolute deadline on the event loop clock
+request_deadline: ContextVar[float | None] = ContextVar(
+    'request_deadline', default=None
+)
+
+
+def remaining_seconds() -> float | None:
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+
+    return deadline - asyncio.get_running_loop().time()
+
+
+def _route_timeout(path: str) -> float:
+    for pattern, timeout in ROUTE_TIMEOUTS:
+        if pattern.match(path):
+            return timeout
+
+    return settings.REQUEST_TIMEOUT_SECONDS
+
+
+def _request_timeout(scope) -> float:
+    timeout = _route_timeout(scope['path'])
+
+    for name, value in scope['headers']:
+        if name == TIMEOUT_HEADER:
+            try:
+                requested = float(value)
+            except ValueError:
+                break
+            if requested > 0:
+                timeout = min(requested, timeout or requested)
+            break
+
+    return min(timeout, settings.REQUEST_TIMEOUT_MAX_SECONDS)
+
+
+class DeadlineMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        timeout = _request_timeout(scope) if scope['type'] == 'http' else 0
+        if timeout <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        deadline = asyncio.get_running_loop().time() + timeout
+        token = request_deadline.set(deadline)
+
+        try:
+            async with asyncio.timeout_at(deadline):
+                await self.app(scope, receive, send_wrapper)
+        except (TimeoutError, DBAPIError):
+            # an interrupted statement surfaces as a DBAPIError
+            if started or asyncio.get_running_loop().time() < deadline:
+                raise
+            await _send_timeout(send)
+        finally:
+            request_deadline.reset(token)
+
+
+async def _send_timeout(send):
+    body = json.dumps({'detail': 'Request timed out'}).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': HTTPStatus.GATEWAY_TIMEOUT,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _interrupt_sqlite(driver_connection):
+    # sqlite3's interrupt is thread-safe, aiosqlite only wraps it in a
+    # coroutine; the query running on its worker thread fails right away
+    driver_connection._conn.interrupt()  # noqa: SLF001
+
+
+def _arm_statement_timeout(conn, cursor, statement, parameters, context, _):
+    deadline = request_deadline.get()
+    if deadline is None:
+        return
+
+    conn.info['deadline_timer'] = asyncio.get_running_loop().call_at(
+        deadline, _interrupt_sqlite, conn.connection.driver_connection
+    )
+
+
+def _disarm_statement_timeout(conn, *args):
+    timer = conn.info.pop('deadline_timer', None)
+    if timer is not None:
+        timer.cancel()
+
+
+def _stop_on_error(context):
+    if context.connection is None:
+        return
+
+    _disarm_statement_timeout(context.connection)
+    # a cancelled task only stops awaiting, the statement would keep the
+    # connection busy on aiosqlite's thread until it finished on its own
+    if isinstance(context.original_exception, asyncio.CancelledError):
+        _interrupt_sqlite(context.connection.connection.driver_connection)
+
+
+def _set_statement_timeout(conn):
+    remaining = remaining_seconds()
+    if remaining is not None:
+        conn.exec_driver_sql(
+            f'SET LOCAL statement_timeout = {max(1, int(remaining * 1000))}'
+        )
+
+
+def enforce_deadlines(engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+
+    if engine.dialect.name == 'sqlite':
+        # SQLite has no statement timeout, a timer interrupts it instead
+        event.listen(
+            sync_engine, 'before_cursor_execute', _arm_statement_timeout
+        )
+        event.listen(
+            sync_engine, 'after_cursor_execute', _disarm_statement_timeout
+        )
+        event.listen(sync_engine, 'handle_error', _stop_on_error)
+    elif engine.dialect.name == 'postgresql':
+        event.listen(sync_engine, 'begin', _set_statement_timeout)
@@ -0,0 +1,38 @@
+from hashlib import blake2b
+
+
+def _digest(*parts) -> str:
+    return blake2b(
+        ':'.join(str(part) for part in parts).encode(), digest_size=16
+    ).hexdigest()
+
+
+def user_etag(user) -> str:
+    # updated_at only has second resolution on SQLite, so the public fields
+    # go in as well to keep the tag strong
+    digest = _digest(
+        user.id, user.updated_at.isoformat(), user.username, user.email
+    )
+    return f'"{digest}"'
+
+
+def user_list_etag(users, next_cursor: str | None = None) -> str:
+    return f'"{_digest(*(user_etag(user) for user in users), next_cursor)}"'
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+
+    for candidate in header.split(','):
+        candidate = candidate.strip()  # noqa: PLW2901
+        if candidate.startswith('W/'):
+            if not weak:
+                continue
+            candidate = candidate.removeprefix('W/')  # noqa: PLW2901
+        if candidate == etag:
+            return True
+
+    return False
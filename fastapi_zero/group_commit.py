@@ -0,0 +1,131 @@
+import asyncio
+from contextlib import suppress
+from contextvars import Context
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+
+def _begin_immediate(conn):
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+async def _prepare_connection(conn: AsyncConnection):
+    if conn.dialect.name == 'sqlite':
+        # pysqlite defers BEGIN until the first DML, which would turn each
+        # SAVEPOINT into its own transaction
+        await conn.execution_options(isolation_level='AUTOCOMMIT')
+        event.listen(conn.sync_connection, 'begin', _begin_immediate)
+
+
+class GroupCommitWriter:
+    def __init__(
+        self, engine: AsyncEngine, window_seconds: float, max_batch: int
+    ):
+        self.engine = engine
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            # a fresh context, or the writer would inherit the deadline and
+            # request stats of whichever request happened to start it
+            self._task = asyncio.create_task(self._run(), context=Context())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+
+        self._fail_pending(RuntimeError('Writer stopped'))
+        self._task = None
+        self._queue = None
+
+    async def execute(self, statement):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((statement, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window_seconds
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._queue.get(), timeout)
+                )
+            except TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        try:
+            async with self.engine.connect() as conn:
+                await _prepare_connection(conn)
+                while True:
+                    await self._flush(conn, await self._collect())
+        except Exception as exc:  # noqa: BLE001
+            # lost the writer connection: fail queued writes and let the
+            # next execute() start a fresh writer
+            self._task = None
+            self._fail_pending(exc)
+
+    def _fail_pending(self, exc: BaseException):
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(exc)
+
+    @staticmethod
+    async def _apply(conn: AsyncConnection, batch):
+        outcomes = []
+
+        for statement, future in batch:
+            if future.done():
+                outcomes.append((None, None))
+                continue
+            try:
+                async with conn.begin_nested():
+                    rows = (await conn.execute(statement)).all()
+                outcomes.append((rows, None))
+            except DBAPIError as exc:
+                outcomes.append((None, exc))
+
+        return outcomes
+
+    async def _flush(self, conn: AsyncConnection, batch):
+        try:
+            async with conn.begin():
+                outcomes = await self._apply(conn, batch)
+        except Exception as exc:  # noqa: BLE001
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+
+        for (_, future), (rows, exc) in zip(batch, outcomes, strict=True):
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(rows)
@@ -0,0 +1,295 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _format_labels(labelnames: tuple[str, ...], labels: tuple) -> str:
+    if not labelnames:
+        return ''
+
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value)
+            .replace('\\', r'\\')
+            .replace('"', r'\"')
+            .replace('\n', r'\n'),
+        )
+        for name, value in zip(labelnames, labels, strict=True)
+    )
+    return f'{{{pairs}}}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        function: Callable[[], float] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: tuple = ()):
+        self._values[labels] = value
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, '', self.function()
+        else:
+            yield from super().samples()
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # per label set: [bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 2)
+
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        series = self._values.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self):
+        labelnames = (*self.labelnames, 'le')
+
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*self.buckets, '+Inf'), series[:-1], strict=True
+            ):
+                cumulative += bucket_count
+                yield (
+                    f'{self.name}_bucket',
+                    _format_labels(labelnames, (*labels, bound)),
+                    cumulative,
+                )
+
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_count', label_text, cumulative
+            yield f'{self.name}_sum', label_text, series[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(
+                f'{name}{labels} {value}'
+                for name, labels, value in metric.samples()
+            )
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+http_requests_in_flight = REGISTRY.register(
+    Gauge('http_requests_in_flight', 'Requests currently being served.')
+)
+http_request_duration = REGISTRY.register(
+    Histogram(
+        'http_request_duration_seconds',
+        'Request latency by route.',
+        ('method', 'route', 'status'),
+    )
+)
+db_query_duration = REGISTRY.register(
+    Histogram('db_query_duration_seconds', 'Latency of each SQL statement.')
+)
+db_queries_per_request = REGISTRY.register(
+    Histogram(
+        'db_queries_per_request',
+        'SQL statements executed per request.',
+        ('route',),
+        buckets=QUERY_COUNT_BUCKETS,
+    )
+)
+db_time_per_request = REGISTRY.register(
+    Histogram(
+        'db_time_per_request_seconds',
+        'Time spent in SQL per request.',
+        ('route',),
+    )
+)
+password_hash_duration = REGISTRY.register(
+    Histogram(
+        'password_hash_duration_seconds',
+        'Time spent hashing or verifying a password on the executor.',
+        ('operation',),
+    )
+)
+password_hash_wait = REGISTRY.register(
+    Histogram(
+        'password_hash_wait_seconds',
+        'Time a password hash waited for a free executor worker.',
+    )
+)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    query_seconds: float = 0.0
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar(
+    'request_stats', default=None
+)
+request_scope: ContextVar[dict | None] = ContextVar(
+    'request_scope', default=None
+)
+
+
+def current_route() -> str | None:
+    scope = request_scope.get()
+    if scope is None:
+        return None
+
+    # the router only stores the matched route once it has run
+    return getattr(scope.get('route'), 'path', scope['path'])
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, _):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, _):
+    elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+    db_query_duration.observe(elapsed)
+
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+
+def instrument_engine(engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+
+    if not event.contains(
+        sync_engine, 'before_cursor_execute', _before_cursor_execute
+    ):
+        event.listen(
+            sync_engine, 'before_cursor_execute', _before_cursor_execute
+        )
+        event.listen(
+            sync_engine, 'after_cursor_execute', _after_cursor_execute
+        )
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        scope_token = request_scope.set(scope)
+        http_requests_in_flight.inc()
+        started_at = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            http_requests_in_flight.dec()
+            request_stats.reset(token)
+            request_scope.reset(scope_token)
+
+            route = scope.get('route')
+            route_path = getattr(route, 'path', 'unmatched')
+            http_request_duration.observe(
+                elapsed, (scope['method'], route_path, status)
+            )
+            db_queries_per_request.observe(stats.queries, (route_path,))
+            db_time_per_request.observe(stats.query_seconds, (route_path,))
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy import DDL, ForeignKey, Index, event, func, literal_column
 from sqlalchemy.orm import Mapped, mapped_column, registry
 
 table_registry = registry()
@@ -20,3 +20,71 @@ class User:
     updated_at: Mapped[datetime] = mapped_column(
         init=False, server_default=func.now(), onupdate=func.now()
     )
+
+
+@table_registry.mapped_as_dataclass
+class RefreshToken:
+    __tablename__ = 'refresh_tokens'
+
+    jti: Mapped[str] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='CASCADE'), index=True
+    )
+    expires_at: Mapped[datetime]
+    used_at: Mapped[datetime | None] = mapped_column(default=None)
+
+
+@table_registry.mapped_as_dataclass
+class RevokedToken:
+    __tablename__ = 'revoked_tokens'
+    # ids must never be reused after a purge, workers sync on id > last_id
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id: Mapped[int] = mapped_column(init=False, primary_key=True)
+    jti: Mapped[str] = mapped_column(unique=True)
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+
+
+def email_domain(email):
+    # literals instead of bound parameters, otherwise SQLite will not match
+    # the expression against ix_users_email_domain
+    return func.lower(
+        func.substr(
+            email,
+            func.instr(email, literal_column("'@'")) + literal_column('1'),
+        )
+    )
+
+
+Index('ix_users_email_domain', email_domain(User.__table__.c.email)).ddl_if(
+    dialect='sqlite'
+)
+
+USERS_FTS_DDL = (
+    'CREATE VIRTUAL TABLE users_fts USING fts5('
+    "username, email, content='users', content_rowid='id', prefix='2 3')",
+    'CREATE TRIGGER users_fts_ai AFTER INSERT ON users BEGIN '
+    'INSERT INTO users_fts(rowid, username, email) '
+    'VALUES (new.id, new.username, new.email); END',
+    'CREATE TRIGGER users_fts_ad AFTER DELETE ON users BEGIN '
+    'INSERT INTO users_fts(users_fts, rowid, username, email) '
+    "VALUES ('delete', old.id, old.username, old.email); END",
+    'CREATE TRIGGER users_fts_au AFTER UPDATE OF username, email ON users '
+    'BEGIN '
+    'INSERT INTO users_fts(users_fts, rowid, username, email) '
+    "VALUES ('delete', old.id, old.username, old.email); "
+    'INSERT INTO users_fts(rowid, username, email) '
+    'VALUES (new.id, new.username, new.email); END',
+)
+
+for statement in USERS_FTS_DDL:
+    event.listen(
+        User.__table__,
+        'after_create',
+        DDL(statement).execute_if(dialect='sqlite'),
+    )
+event.listen(
+    User.__table__,
+    'before_drop',
+    DDL('DROP TABLE IF EXISTS users_fts').execute_if(dialect='sqlite'),
+)
@@ -0,0 +1,26 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+CURSOR_PREFIX = 'id:'
+
+
+def encode_cursor(last_id: int) -> str:
+    raw = f'{CURSOR_PREFIX}{last_id}'.encode()
+    return urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    padded = cursor + '=' * (-len(cursor) % 4)
+
+    try:
+        raw = urlsafe_b64decode(padded).decode()
+    except (BinasciiError, UnicodeDecodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+    if not raw.startswith(CURSOR_PREFIX):
+        raise ValueError('Invalid cursor')
+
+    try:
+        return int(raw.removeprefix(CURSOR_PREFIX))
+    except ValueError as exc:
+        raise ValueError('Invalid cursor') from exc
@@ -0,0 +1,229 @@
+import asyncio
+import cProfile
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from hashlib import sha256
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from fastapi_zero.settings import Settings
+
+PROFILE_HEADER = b'x-profile'
+
+settings = Settings()
+
+
+def sign_profile_request(secret: str, ttl_seconds: float = 300) -> str:
+    expires = str(int(time.time() + ttl_seconds))
+    signature = hmac.new(secret.encode(), expires.encode(), sha256)
+    return f'{expires}.{signature.hexdigest()}'
+
+
+def _valid_signature(secret: str, value: bytes) -> bool:
+    expires, _, signature = value.decode('latin-1').partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+
+    expected = hmac.new(secret.encode(), expires.encode(), sha256)
+    return hmac.compare_digest(expected.hexdigest(), signature)
+
+
+def _frame_label(kind: str, label: str) -> str:
+    # collapsed stacks are ';'-separated, one stack per line
+    label = ' '.join(label.split()).replace(';', ',')
+    return f'{kind} {label[:80]}'
+
+
+class Profile:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.started_at = time.perf_counter()
+        self.spans: list[dict] = []
+        # labels of the SQL statement or hash running right now, for the
+        # sampler to append to the stack it sees
+        self.active: list[str] = []
+        self.stacks: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self._profiler: cProfile.Profile | None = None
+
+    def start(self, profile_format: str):
+        if profile_format == 'pstats':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = threading.Thread(
+                target=self._sample, name='profile-sampler', daemon=True
+            )
+            self._sampler.start()
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._stopped.set()
+            self._sampler.join()
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(
+                    f'{code.co_name} ({code.co_filename}:{frame.f_lineno})'
+                )
+                frame = frame.f_back
+            frames.reverse()
+            frames.extend(f'[{label}]' for label in list(self.active))
+            self.stacks[';'.join(frames)] += 1
+
+    def push(self, kind: str, label: str) -> dict:
+        span = {
+            'kind': kind,
+            'label': label,
+            'start_ms': (time.perf_counter() - self.started_at) * 1000,
+        }
+        self.spans.append(span)
+        self.active.append(_frame_label(kind, label))
+        return span
+
+    def pop(self, span: dict):
+        span['duration_ms'] = (
+            time.perf_counter() - self.started_at
+        ) * 1000 - span['start_ms']
+        label = _frame_label(span['kind'], span['label'])
+        if label in self.active:
+            self.active.remove(label)
+
+    def dump(self, base: Path) -> Path:
+        base.parent.mkdir(parents=True, exist_ok=True)
+        base.with_suffix('.spans.json').write_text(
+            json.dumps(self.spans, indent=2), encoding='utf-8'
+        )
+
+        if self._profiler is not None:
+            path = base.with_suffix('.prof')
+            self._profiler.dump_stats(path)
+        else:
+            path = base.with_suffix('.folded')
+            path.write_text(
+                ''.join(
+                    f'{stack} {count}\n'
+                    for stack, count in self.stacks.items()
+                ),
+                encoding='utf-8',
+            )
+        return path
+
+
+active_profile: ContextVar[Profile | None] = ContextVar(
+    'active_profile', default=None
+)
+
+
+class profile_span:  # noqa: N801
+    __slots__ = ('kind', 'label', 'profile', 'span')
+
+    def __init__(self, kind: str, label: str):
+        self.kind = kind
+        self.label = label
+
+    def __enter__(self):
+        self.profile = active_profile.get()
+        if self.profile is not None:
+            self.span = self.profile.push(self.kind, self.label)
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.pop(self.span)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, _):
+    profile = active_profile.get()
+    if profile is not None:
+        conn.info['profile_span'] = (profile, profile.push('sql', statement))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, _):
+    profile_span = conn.info.pop('profile_span', None)
+    if profile_span is not None:
+        profile, span = profile_span
+        profile.pop(span)
+
+
+def annotate_engine(engine: AsyncEngine):
+    event.listen(
+        engine.sync_engine, 'before_cursor_execute', _before_cursor_execute
+    )
+    event.listen(
+        engine.sync_engine, 'after_cursor_execute', _after_cursor_execute
+    )
+
+
+def profiling_enabled() -> bool:
+    return settings.PROFILE_SAMPLE_RATE > 0 or bool(settings.PROFILE_SECRET)
+
+
+def _selected(scope) -> bool:
+    if settings.PROFILE_SECRET:
+        for name, value in scope['headers']:
+            if name == PROFILE_HEADER:
+                return _valid_signature(settings.PROFILE_SECRET, value)
+
+    return random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.enabled = profiling_enabled()
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        # one profile at a time: cProfile cannot nest, and concurrent
+        # requests would show up in each other's samples anyway
+        if (
+            not self.enabled
+            or scope['type'] != 'http'
+            or self._busy
+            or not _selected(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        base = Path(settings.PROFILE_DIRECTORY) / (
+            f'{time.time_ns()}-{scope["method"]}'
+            f'{scope["path"].replace("/", "_")}'
+        )
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (b'x-profile-id', base.name.encode()),
+                ]
+            await send(message)
+
+        profile = Profile(
+            threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        )
+        token = active_profile.set(profile)
+        profile.start(settings.PROFILE_FORMAT)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.stop()
+            active_profile.reset(token)
+            self._busy = False
+            await asyncio.to_thread(profile.dump, base)
@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from fastapi_zero.models import RefreshToken, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# a used refresh token is kept this long so a replay still revokes its family
+REFRESH_REUSE_WINDOW = timedelta(days=1)
+
+
+class Denylist:
+    def __init__(self):
+        self.last_id = 0
+        self._expires: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self):
+        return len(self._expires)
+
+    def __contains__(self, jti: str):
+        return jti in self._expires
+
+    def add(self, jti: str, expires_at: float):
+        if jti not in self._expires:
+            self._expires[jti] = expires_at
+            heapq.heappush(self._heap, (expires_at, jti))
+        self.purge()
+
+    def purge(self, now: float | None = None):
+        # an expired token is rejected by its exp claim, so its jti can go
+        now = time.time() if now is None else now
+        while self._heap and self._heap[0][0] <= now:
+            _, jti = heapq.heappop(self._heap)
+            self._expires.pop(jti, None)
+
+    def clear(self):
+        self.last_id = 0
+        self._expires.clear()
+        self._heap.clear()
+
+
+revoked_tokens = Denylist()
+
+
+async def revoke_token(session: AsyncSession, jti: str, expires_at: float):
+    await session.execute(
+        insert(RevokedToken)
+        .values(
+            jti=jti,
+            expires_at=datetime.fromtimestamp(expires_at, tz=ZoneInfo('UTC')),
+        )
+        .prefix_with('OR IGNORE', dialect='sqlite')
+    )
+    await session.commit()
+    revoked_tokens.add(jti, expires_at)
+
+
+async def purge_tokens(session: AsyncSession, now: datetime):
+    await session.execute(
+        delete(RevokedToken).where(RevokedToken.expires_at <= now)
+    )
+    await session.execute(
+        delete(RefreshToken).where(
+            or_(
+                RefreshToken.expires_at <= now,
+                RefreshToken.used_at <= now - REFRESH_REUSE_WINDOW,
+            )
+        )
+    )
+
+
+async def sync_revocations(bind, purge: bool = False):
+    now = datetime.now(tz=ZoneInfo('UTC'))
+
+    async with AsyncSession(bind) as session, session.begin():
+        if purge:
+            await purge_tokens(session, now)
+
+        rows = await session.execute(
+            select(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)
+            .where(
+                RevokedToken.id > revoked_tokens.last_id,
+                RevokedToken.expires_at > now,
+            )
+            .order_by(RevokedToken.id)
+        )
+        for row in rows:
+            revoked_tokens.add(
+                row.jti,
+                row.expires_at.replace(tzinfo=ZoneInfo('UTC')).timestamp(),
+            )
+            revoked_tokens.last_id = row.id
+
+
+async def load_revocations(bind):
+    revoked_tokens.clear()
+    try:
+        await sync_revocations(bind, purge=True)
+    except DBAPIError:
+        logger.warning('Skipping revocation load, table is missing')
+
+
+async def run_revocation_sync(engine: AsyncEngine, interval: float):
+    # picks up tokens revoked by the other workers
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sync_revocations(engine)
+        except DBAPIError:
+            logger.exception('Revocation sync failed')
+
+
+async def run_token_purge(engine: AsyncEngine, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSession(engine) as session, session.begin():
+                await purge_tokens(session, datetime.now(tz=ZoneInfo('UTC')))
+        except DBAPIError:
+            logger.exception('Token purge failed')
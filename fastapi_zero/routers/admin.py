@@ -0,0 +1,40 @@
+import hmac
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from fastapi_zero.schemas import SlowQueryList
+from fastapi_zero.settings import Settings
+from fastapi_zero.slow_queries import slow_queries
+
+settings = Settings()
+
+
+def require_admin(x_admin_token: Annotated[str | None, Header()] = None):
+    # without a configured token the admin routes do not exist
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND)
+
+    if x_admin_token is None or not hmac.compare_digest(
+        x_admin_token.encode(), settings.ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN, detail='Not enough permissions'
+        )
+
+
+router = APIRouter(
+    prefix='/admin',
+    tags=['admin'],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@router.get('/slow-queries', response_model=SlowQueryList)
+async def read_slow_queries():
+    return {
+        'threshold_ms': slow_queries.threshold_ms,
+        # newest first
+        'queries': list(reversed(slow_queries.entries)),
+    }
@@ -1,39 +1,187 @@
+from datetime import datetime, timedelta
 from http import HTTPStatus
 from typing import Annotated
+from uuid import uuid4
+from zoneinfo import ZoneInfo
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import select
+from jwt import InvalidTokenError, decode
+from sqlalchemy import insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi_zero.database import get_session
-from fastapi_zero.models import User
-from fastapi_zero.schemas import Token
+from fastapi_zero.admission import admit_hash_request
+from fastapi_zero.database import get_read_session, get_session
+from fastapi_zero.models import RefreshToken, User
+from fastapi_zero.revocation import revoke_token
+from fastapi_zero.schemas import Message, RefreshTokenRequest, Token
 from fastapi_zero.security import (
     create_acess_token,
-    verify_password,
+    create_refresh_token,
+    decode_refresh_token,
+    get_current_user,
+    invalidate_cached_user,
+    oauth2_scheme,
+    settings,
+    verify_and_update_password_async,
 )
 
 DbSession = Annotated[AsyncSession, Depends(get_session)]
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
 OAuth2Form = Annotated[OAuth2PasswordRequestForm, Depends()]
+CurrentUser = Annotated[User, Depends(get_current_user)]
+BearerToken = Annotated[str, Depends(oauth2_scheme)]
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 
+invalid_refresh_token = HTTPException(
+    status_code=HTTPStatus.UNAUTHORIZED,
+    detail='Invalid refresh token',
+    headers={'WWW-Authenticate': 'Bearer'},
+)
+
+
+async def _issue_tokens(session: AsyncSession, user_id: int, email: str):
+    jti = uuid4().hex
+    expire = datetime.now(tz=ZoneInfo('UTC')) + timedelta(
+        days=settings.REFRESH_TOKEN_EXPIRE_DAYS
+    )
+
+    await session.execute(
+        insert(RefreshToken).values(
+            jti=jti, user_id=user_id, expires_at=expire
+        )
+    )
+    await session.commit()
+
+    return {
+        'access_token': create_acess_token({'sub': email}),
+        'refresh_token': create_refresh_token(email, jti, expire),
+        'token_type': 'Bearer',
+    }
 
-@router.post('/token', response_model=Token)
+
+@router.post(
+    '/token',
+    response_model=Token,
+    dependencies=[Depends(admit_hash_request)],
+)
 async def login_for_acess_token(
     form_data: OAuth2Form,
     session: DbSession,
+    read_session: ReadSession,
 ):
-    user = await session.scalar(
-        select(User).where(User.email == form_data.username)
-    )
+    # looked up on the reader, the writer connection is only taken after
+    # the hash, for the rehash and the refresh token
+    user = (
+        await read_session.execute(
+            select(User.id, User.email, User.password).where(
+                User.email == form_data.username
+            )
+        )
+    ).first()
 
-    if not user or not verify_password(form_data.password, user.password):
+    valid, updated_hash = False, None
+    if user:
+        valid, updated_hash = await verify_and_update_password_async(
+            form_data.password, user.password
+        )
+    if not valid:
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail='Incorret email or password',
         )
 
-    access_token = create_acess_token({'sub': user.email})
-    return {'access_token': access_token, 'token_type': 'Bearer'}
+    if updated_hash is not None:
+        # stored with older argon2 parameters; keeping updated_at leaves
+        # the user's ETag alone; committed with the new refresh token
+        await session.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(password=updated_hash, updated_at=User.updated_at)
+        )
+        invalidate_cached_user(user.email)
+
+    return await _issue_tokens(session, user.id, user.email)
+
+
+@router.post('/refresh_token', response_model=Token)
+async def refresh_access_token(body: RefreshTokenRequest, session: DbSession):
+    try:
+        payload = decode_refresh_token(body.refresh_token)
+    except InvalidTokenError:
+        raise invalid_refresh_token
+
+    now = datetime.now(tz=ZoneInfo('UTC'))
+    # claiming the token is a single conditional UPDATE, so two concurrent
+    # refreshes with the same token cannot both succeed
+    user_id = await session.scalar(
+        update(RefreshToken)
+        .where(
+            RefreshToken.jti == payload['jti'],
+            RefreshToken.used_at.is_(None),
+            RefreshToken.expires_at > now,
+        )
+        .values(used_at=now)
+        .returning(RefreshToken.user_id)
+    )
+
+    if user_id is None:
+        # a replayed token means it leaked: revoke the rest of its family
+        await session.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.user_id.in_(
+                    select(RefreshToken.user_id).where(
+                        RefreshToken.jti == payload['jti'],
+                        RefreshToken.used_at.is_not(None),
+                    )
+                ),
+                RefreshToken.used_at.is_(None),
+            )
+            .values(used_at=now)
+        )
+        await session.commit()
+        raise invalid_refresh_token
+
+    email = await session.scalar(select(User.email).where(User.id == user_id))
+    # a token must still belong to the account it was issued to, even if
+    # its user id has been handed to someone else since
+    if email is None or email != payload.get('sub'):
+        await session.commit()
+        raise invalid_refresh_token
+
+    return await _issue_tokens(session, user_id, email)
+
+
+@router.post('/logout', response_model=Message)
+async def logout(
+    current_user: CurrentUser,
+    token: BearerToken,
+    session: DbSession,
+    body: RefreshTokenRequest | None = None,
+):
+    if body is not None:
+        try:
+            refresh_jti = decode_refresh_token(body.refresh_token)['jti']
+        except InvalidTokenError:
+            raise invalid_refresh_token
+
+        await session.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.jti == refresh_jti,
+                RefreshToken.user_id == current_user.id,
+                RefreshToken.used_at.is_(None),
+            )
+            .values(used_at=datetime.now(tz=ZoneInfo('UTC')))
+        )
+
+    # get_current_user already verified the signature
+    payload = decode(token, settings.SECRET_KEY, algorithms=settings.ALGORITHM)
+    if payload.get('jti'):
+        await revoke_token(session, payload['jti'], payload['exp'])
+    else:
+        await session.commit()
+
+    return {'message': 'Logged out'}
@@ -1,116 +1,597 @@
+import asyncio
+import csv
+import io
+import re
+import time
+from functools import partial
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import column, delete, insert, select, table, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi_zero.database import get_session
-from fastapi_zero.models import User
+from fastapi_zero.admission import admit_hash_request, charge_hashes
+from fastapi_zero.database import (
+    get_group_commit_writer,
+    get_read_session,
+    get_session,
+)
+from fastapi_zero.etag import etag_matches, user_etag, user_list_etag
+from fastapi_zero.group_commit import GroupCommitWriter
+from fastapi_zero.models import User, email_domain
+from fastapi_zero.pagination import decode_cursor, encode_cursor
 from fastapi_zero.schemas import (
     FilterPage,
     Message,
+    UserBatch,
+    UserBulkItem,
+    UserBulkResult,
+    UserIds,
     UserList,
     UserPublic,
     UserSchema,
+    UserSearch,
 )
 from fastapi_zero.security import (
+    fetch_user_row,
     get_current_user,
-    get_password_hash,
+    get_password_hash_async,
+    invalidate_cached_user,
+    invalidate_user_row,
+    user_row_generations,
+)
+from fastapi_zero.serialization import (
+    FastJSONResponse,
+    user_adapter,
+    user_page_adapter,
+    user_row,
 )
+from fastapi_zero.settings import Settings
+from fastapi_zero.singleflight import user_lookups
 
 router = APIRouter(prefix='/users', tags=['users'])
 DbSession = Annotated[AsyncSession, Depends(get_session)]
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
 CurrentUser = Annotated[User, Depends(get_current_user)]
+IfNoneMatch = Annotated[str | None, Header()]
+IfMatch = Annotated[str | None, Header()]
+Writer = Annotated[GroupCommitWriter | None, Depends(get_group_commit_writer)]
+settings = Settings()
 
+EXPORT_FIELDS = tuple(UserPublic.model_fields)
+EXPORT_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+USERS_FTS = table('users_fts', column('rowid'), column('users_fts'))
+# the highest code point sorts after any continuation of a prefix
+PREFIX_UPPER_BOUND = chr(0x10FFFF)
+# bound parameters per statement; SQLite builds before 3.32 cap at 999
+DIALECT_PARAMETER_LIMITS = {'sqlite': 999, 'postgresql': 32767}
 
-@router.post('/', status_code=HTTPStatus.CREATED, response_model=UserPublic)
-async def create_user(user: UserSchema, session: DbSession):
-    db_user = await session.scalar(
-        select(User).where(
-            (User.username == user.username) | (User.email == user.email)
-        )
+
+def _chunk_size(session: AsyncSession) -> int:
+    return min(
+        settings.BATCH_LOOKUP_CHUNK_SIZE,
+        DIALECT_PARAMETER_LIMITS.get(session.bind.dialect.name, 999),
     )
 
-    if db_user:
-        if db_user.username == user.username:
-            detail_message = 'Username already exists'
+
+def _conflict_detail(exc: IntegrityError) -> str:
+    message = str(exc.orig)
+
+    if 'username' in message:
+        return 'Username already exists'
+    if 'email' in message:
+        return 'Email already exists'
+    return 'Username or Email already exists'
+
+
+async def _execute_write(
+    session: AsyncSession, writer: GroupCommitWriter | None, statement
+):
+    if writer is not None:
+        rows = await writer.execute(statement)
+        return rows[0] if rows else None
+
+    row = (await session.execute(statement)).first()
+    await session.commit()
+    return row
+
+
+@router.post(
+    '/',
+    status_code=HTTPStatus.CREATED,
+    response_model=UserPublic,
+    dependencies=[Depends(admit_hash_request)],
+)
+async def create_user(user: UserSchema, session: DbSession, writer: Writer):
+    user_data = user.model_dump()
+    user_data['password'] = await get_password_hash_async(user.password)
+
+    try:
+        db_user = await _execute_write(
+            session,
+            writer,
+            insert(User)
+            .values(**user_data)
+            .returning(User.id, User.username, User.email),
+        )
+    except IntegrityError as exc:
+        await session.rollback()
+        raise HTTPException(
+            detail=_conflict_detail(exc), status_code=HTTPStatus.CONFLICT
+        )
+
+    return db_user
+
+
+def _bulk_conflicts(users: list[UserSchema], existing_rows) -> dict[int, str]:
+    taken_usernames = {row.username for row in existing_rows}
+    taken_emails = {row.email for row in existing_rows}
+    conflicts = {}
+
+    for index, user in enumerate(users):
+        if user.username in taken_usernames:
+            conflicts[index] = 'Username already exists'
+        elif user.email in taken_emails:
+            conflicts[index] = 'Email already exists'
         else:
-            detail_message = 'Email already exists'
+            taken_usernames.add(user.username)
+            taken_emails.add(user.email)
+
+    return conflicts
+
 
+async def insert_users_batch(session: AsyncSession, rows: list[dict]):
+    statement = insert(User).returning(User.id, sort_by_parameter_order=True)
+
+    try:
+        ids = (await session.scalars(statement, rows)).all()
+        await session.commit()
+        return ids
+    except IntegrityError:
+        # lost a race with a concurrent writer: retry row by row
+        await session.rollback()
+
+    ids = []
+    for row in rows:
+        try:
+            ids.append(await session.scalar(statement, [row]))
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            ids.append(None)
+
+    return ids
+
+
+@router.post(
+    '/bulk',
+    status_code=HTTPStatus.OK,
+    response_model=UserBulkResult,
+    dependencies=[Depends(admit_hash_request)],
+)
+async def create_users_bulk(
+    users: list[UserSchema],
+    request: Request,
+    session: DbSession,
+    read_session: ReadSession,
+    current_user: CurrentUser,
+):
+    started_at = time.perf_counter()
+
+    if len(users) > settings.BULK_MAX_ITEMS:
         raise HTTPException(
-            detail=detail_message, status_code=HTTPStatus.CONFLICT
+            detail=f'At most {settings.BULK_MAX_ITEMS} users per request',
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
         )
 
-    user_data = user.model_dump()
-    user_data['password'] = get_password_hash(user.password)
+    # on the reader, so the writer holds no transaction while the first
+    # batch is hashed; two IN lists per statement share the parameter budget
+    chunk_size = max(1, _chunk_size(read_session) // 2)
+    existing_rows = []
+    for start in range(0, len(users), chunk_size):
+        chunk = users[start : start + chunk_size]
+        existing_rows += await read_session.execute(
+            select(User.username, User.email).where(
+                User.username.in_({user.username for user in chunk})
+                | User.email.in_({user.email for user in chunk})
+            )
+        )
+    conflicts = _bulk_conflicts(users, existing_rows)
 
-    db_user = User(**user_data)
+    pending = [index for index in range(len(users)) if index not in conflicts]
+    # admission already took one token for the request
+    charge_hashes(request, len(pending) - 1)
+    hash_slots = asyncio.Semaphore(settings.BULK_HASH_CONCURRENCY)
 
-    session.add(db_user)
-    await session.commit()
-    await session.refresh(db_user)
+    async def hash_password(password: str):
+        async with hash_slots:
+            return await get_password_hash_async(password)
 
-    return db_user
+    created_ids = {}
+    batch_size = settings.BULK_INSERT_BATCH_SIZE
+    # each batch is hashed and committed before the next one starts, so a
+    # large import holds neither every hash nor one long transaction
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
+        hashes = await asyncio.gather(
+            *(hash_password(users[index].password) for index in batch)
+        )
+        rows = [
+            {**users[index].model_dump(), 'password': password}
+            for index, password in zip(batch, hashes, strict=True)
+        ]
+        ids = await insert_users_batch(session, rows)
+        for index, user_id in zip(batch, ids, strict=True):
+            if user_id is None:
+                conflicts[index] = 'Username or Email already exists'
+            else:
+                created_ids[index] = user_id
 
+    results = [
+        UserBulkItem(
+            index=index,
+            username=user.username,
+            status='conflict' if index in conflicts else 'created',
+            id=created_ids.get(index),
+            detail=conflicts.get(index),
+        )
+        for index, user in enumerate(users)
+    ]
+    elapsed_seconds = time.perf_counter() - started_at
+
+    return UserBulkResult(
+        results=results,
+        created=len(created_ids),
+        conflicts=len(conflicts),
+        elapsed_seconds=elapsed_seconds,
+        rows_per_second=len(created_ids) / elapsed_seconds,
+    )
 
-@router.get('/', status_code=HTTPStatus.OK, response_model=UserList)
+
+@router.get(
+    '/',
+    status_code=HTTPStatus.OK,
+    response_model=UserList,
+    response_model_exclude_unset=True,
+)
 async def read_users(
-    session: DbSession,
+    session: ReadSession,
     current_user: CurrentUser,
     filter_users: Annotated[FilterPage, Query()],
+    if_none_match: IfNoneMatch = None,
 ):
-    users = await session.scalars(
-        select(User).limit(filter_users.limit).offset(filter_users.offset)
+    # only what the page and its ETag need, no ORM objects to build
+    query = (
+        select(User.username, User.email, User.id, User.updated_at)
+        .order_by(User.id)
+        .limit(filter_users.limit)
+    )
+
+    if filter_users.cursor is not None:
+        try:
+            after_id = decode_cursor(filter_users.cursor)
+        except ValueError:
+            raise HTTPException(
+                detail='Invalid cursor', status_code=HTTPStatus.BAD_REQUEST
+            )
+        query = query.where(User.id > after_id)
+    else:
+        query = query.offset(filter_users.offset)
+
+    rows = (await session.execute(query)).all()
+    page = {
+        'users': [
+            user_row(username, email, user_id)
+            for username, email, user_id, _ in rows
+        ]
+    }
+    if filter_users.limit and len(rows) == filter_users.limit:
+        page['next_cursor'] = encode_cursor(rows[-1].id)
+
+    etag = user_list_etag(rows, page.get('next_cursor'))
+    if etag_matches(if_none_match, etag):
+        return Response(
+            status_code=HTTPStatus.NOT_MODIFIED, headers={'ETag': etag}
+        )
+
+    return FastJSONResponse(
+        user_page_adapter.dump_json(page), headers={'ETag': etag}
+    )
+
+
+def _users_to_ndjson(users) -> str:
+    return ''.join(
+        user_adapter.dump_json(
+            user_row(user.username, user.email, user.id)
+        ).decode()
+        + '\n'
+        for user in users
+    )
+
+
+def _users_to_csv(users, header: bool = False) -> str:
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer)
+
+    if header:
+        csv_writer.writerow(EXPORT_FIELDS)
+
+    csv_writer.writerows(
+        [getattr(user, field) for field in EXPORT_FIELDS] for user in users
     )
+    return buffer.getvalue()
+
+
+async def _stream_users(session: AsyncSession, export_format: str):
+    result = None
+
+    try:
+        if export_format == 'csv':
+            yield _users_to_csv([], header=True)
+
+        result = await session.stream_scalars(
+            select(User)
+            .order_by(User.id)
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+
+        async for users in result.partitions():
+            if export_format == 'csv':
+                yield _users_to_csv(users)
+            else:
+                yield _users_to_ndjson(users)
+    finally:
+        # runs on client disconnect too, so the cursor never outlives it
+        if result is not None:
+            await result.close()
+        await session.close()
+
+
+@router.get('/export', status_code=HTTPStatus.OK)
+async def export_users(
+    session: ReadSession,
+    current_user: CurrentUser,
+    export_format: Annotated[
+        Literal['ndjson', 'csv'], Query(alias='format')
+    ] = 'ndjson',
+):
+    return StreamingResponse(
+        _stream_users(session, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="users.{export_format}"'
+            )
+        },
+    )
+
+
+def _fts_query(text: str) -> str | None:
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms) or None
+
+
+@router.get(
+    '/search',
+    status_code=HTTPStatus.OK,
+    response_model=UserList,
+    response_model_exclude_unset=True,
+)
+async def search_users(
+    session: ReadSession,
+    current_user: CurrentUser,
+    search: Annotated[UserSearch, Query()],
+):
+    query = select(User).order_by(User.id).limit(search.limit)
+
+    if search.username_prefix:
+        # a range instead of LIKE so the username index is used
+        query = query.where(
+            User.username >= search.username_prefix,
+            User.username < search.username_prefix + PREFIX_UPPER_BOUND,
+        )
+    if search.email_domain:
+        query = query.where(
+            email_domain(User.email) == search.email_domain.lower()
+        )
+    if search.q:
+        fts_query = _fts_query(search.q)
+        if fts_query is None:
+            return {'users': []}
+        query = query.where(
+            User.id.in_(
+                select(USERS_FTS.c.rowid).where(
+                    USERS_FTS.c.users_fts.match(fts_query)
+                )
+            )
+        )
+    if search.cursor is not None:
+        try:
+            query = query.where(User.id > decode_cursor(search.cursor))
+        except ValueError:
+            raise HTTPException(
+                detail='Invalid cursor', status_code=HTTPStatus.BAD_REQUEST
+            )
+
+    users = (await session.scalars(query)).all()
+
+    if len(users) == search.limit:
+        return {'users': users, 'next_cursor': encode_cursor(users[-1].id)}
     return {'users': users}
 
 
+async def _lookup_users(session: AsyncSession, ids: list[int]):
+    if len(ids) > settings.BATCH_LOOKUP_MAX_IDS:
+        raise HTTPException(
+            detail=f'At most {settings.BATCH_LOOKUP_MAX_IDS} ids per request',
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+        )
+
+    unique_ids = list(dict.fromkeys(ids))
+    chunk_size = _chunk_size(session)
+    found = {}
+
+    for start in range(0, len(unique_ids), chunk_size):
+        rows = await session.execute(
+            select(User.id, User.username, User.email).where(
+                User.id.in_(unique_ids[start : start + chunk_size])
+            )
+        )
+        found.update((row.id, row) for row in rows)
+
+    return {
+        'users': [found[i] for i in unique_ids if i in found],
+        'missing': [i for i in unique_ids if i not in found],
+    }
+
+
+@router.get('/batch', status_code=HTTPStatus.OK, response_model=UserBatch)
+async def read_users_batch(
+    session: ReadSession, ids: Annotated[list[int], Query(min_length=1)]
+):
+    return await _lookup_users(session, ids)
+
+
+@router.post('/batch', status_code=HTTPStatus.OK, response_model=UserBatch)
+async def read_users_batch_post(user_ids: UserIds, session: ReadSession):
+    return await _lookup_users(session, user_ids.ids)
+
+
 @router.get('/{user_id}', status_code=HTTPStatus.OK, response_model=UserPublic)
-async def read_user(user_id: int, session: DbSession):
-    user_db = await session.scalar(select(User).where(User.id == user_id))
+async def read_user(
+    user_id: int,
+    session: ReadSession,
+    if_none_match: IfNoneMatch = None,
+):
+    user_db = await user_lookups.do(
+        ('id', user_id, user_row_generations.get(user_id)),
+        partial(fetch_user_row, session.bind, User.id == user_id),
+    )
 
     if not user_db:
         raise HTTPException(
             detail='User not found!', status_code=HTTPStatus.NOT_FOUND
         )
 
-    return user_db
+    etag = user_etag(user_db)
+    if etag_matches(if_none_match, etag):
+        return Response(
+            status_code=HTTPStatus.NOT_MODIFIED, headers={'ETag': etag}
+        )
+
+    return FastJSONResponse(
+        user_adapter.dump_json(
+            user_row(user_db.username, user_db.email, user_db.id)
+        ),
+        headers={'ETag': etag},
+    )
+
+
+async def _guard_update(
+    session: AsyncSession, statement, user_id: int, if_match: str
+):
+    stored = (
+        await session.execute(
+            select(User.id, User.username, User.email, User.updated_at).where(
+                User.id == user_id
+            )
+        )
+    ).first()
+
+    if stored is None or not etag_matches(
+        if_match, user_etag(stored), weak=False
+    ):
+        raise HTTPException(
+            status_code=HTTPStatus.PRECONDITION_FAILED,
+            detail='Precondition failed',
+        )
 
+    # compare-and-swap on the public fields, so a write that lands in
+    # between still loses (updated_at would not compare reliably as text on
+    # SQLite)
+    return statement.where(
+        User.username == stored.username, User.email == stored.email
+    )
 
-@router.put('/{user_id}', status_code=HTTPStatus.OK, response_model=UserPublic)
-async def update_user(
+
+@router.put(
+    '/{user_id}',
+    status_code=HTTPStatus.OK,
+    response_model=UserPublic,
+    dependencies=[Depends(admit_hash_request)],
+)
+async def update_user(  # noqa: PLR0913, PLR0917
     user_id: int,
     user: UserSchema,
     session: DbSession,
+    read_session: ReadSession,
     current_user: CurrentUser,
+    writer: Writer,
+    response: Response,
+    if_match: IfMatch = None,
 ):
     if current_user.id != user_id:
         raise HTTPException(
             status_code=HTTPStatus.FORBIDDEN, detail='Not enough permissions'
         )
 
-    try:
-        user_data = user.model_dump(exclude_unset=True)
-
-        for field, value in user_data.items():
-            if field == 'password':
-                setattr(current_user, field, get_password_hash(value))
-            else:
-                setattr(current_user, field, value)
+    statement = update(User).where(User.id == user_id)
+    if if_match is not None:
+        # read on the reader: the writer must not sit in a transaction
+        # while the password below is hashed
+        statement = await _guard_update(
+            read_session, statement, user_id, if_match
+        )
 
-        session.add(current_user)
-        await session.commit()
-        await session.refresh(current_user)
+    previous_email = current_user.email
+    user_data = user.model_dump(exclude_unset=True)
+    if 'password' in user_data:
+        user_data['password'] = await get_password_hash_async(
+            user_data['password']
+        )
 
-        return current_user
+    try:
+        db_user = await _execute_write(
+            session,
+            writer,
+            statement.values(**user_data).returning(
+                User.id, User.username, User.email, User.updated_at
+            ),
+        )
     except IntegrityError:
+        await session.rollback()
         detail_message = 'Username or Email already exists'
         raise HTTPException(
             detail=detail_message, status_code=HTTPStatus.CONFLICT
         )
 
+    invalidate_cached_user(previous_email)
+    invalidate_user_row(user_id)
+
+    if db_user is None and if_match is not None:
+        raise HTTPException(
+            status_code=HTTPStatus.PRECONDITION_FAILED,
+            detail='Precondition failed',
+        )
+    if db_user is None:
+        raise HTTPException(
+            detail='User not found!', status_code=HTTPStatus.NOT_FOUND
+        )
+
+    response.headers['ETag'] = user_etag(db_user)
+    return db_user
+
 
 @router.delete('/{user_id}', response_model=Message)
 async def delete_user(
@@ -123,7 +604,16 @@ async def delete_user(
             status_code=HTTPStatus.FORBIDDEN, detail='Not enough permissions'
         )
 
-    await session.delete(current_user)
+    deleted_id = await session.scalar(
+        delete(User).where(User.id == user_id).returning(User.id)
+    )
     await session.commit()
+    invalidate_cached_user(current_user.email)
+    invalidate_user_row(user_id)
+
+    if deleted_id is None:
+        raise HTTPException(
+            detail='User not found!', status_code=HTTPStatus.NOT_FOUND
+        )
 
     return Message(message='User deleted!')
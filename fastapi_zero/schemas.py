@@ -1,4 +1,7 @@
-from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator
 
 
 class Message(BaseModel):
@@ -20,13 +23,74 @@ class UserPublic(BaseModel):
 
 class UserList(BaseModel):
     users: list[UserPublic]
+    next_cursor: str | None = None
+
+
+class UserIds(BaseModel):
+    ids: list[int] = Field(min_length=1)
+
+
+class UserBatch(BaseModel):
+    users: list[UserPublic]
+    missing: list[int]
+
+
+class UserBulkItem(BaseModel):
+    index: int
+    username: str
+    status: Literal['created', 'conflict']
+    id: int | None = None
+    detail: str | None = None
+
+
+class UserBulkResult(BaseModel):
+    results: list[UserBulkItem]
+    created: int
+    conflicts: int
+    elapsed_seconds: float
+    rows_per_second: float
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
 class FilterPage(BaseModel):
     offset: int = Field(ge=0, default=0)
     limit: int = Field(ge=0, default=10)
+    cursor: str | None = None
+
+
+class UserSearch(BaseModel):
+    username_prefix: str | None = Field(default=None, min_length=1)
+    email_domain: str | None = Field(default=None, min_length=1)
+    q: str | None = Field(default=None, min_length=1)
+    limit: int = Field(ge=1, le=100, default=10)
+    cursor: str | None = None
+
+    @model_validator(mode='after')
+    def require_filter(self):
+        if not (self.username_prefix or self.email_domain or self.q):
+            raise ValueError('At least one search filter is required')
+        return self
+
+
+class SlowQuery(BaseModel):
+    statement: str
+    parameters: list | dict
+    duration_ms: float
+    route: str | None
+    plan: list[str] | None
+    error: str | None = None
+    recorded_at: datetime
+
+
+class SlowQueryList(BaseModel):
+    threshold_ms: float
+    queries: list[SlowQuery]
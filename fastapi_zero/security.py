@@ -1,21 +1,124 @@
+import asyncio
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import partial
 from http import HTTPStatus
+from uuid import uuid4
 from zoneinfo import ZoneInfo
 
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from jwt import DecodeError, decode, encode
+from jwt import InvalidTokenError, decode, encode
 from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
-from fastapi_zero.database import get_session
+from fastapi_zero.cache import Generations, TTLCache
+from fastapi_zero.database import get_read_session
+from fastapi_zero.metrics import (
+    REGISTRY,
+    Gauge,
+    password_hash_duration,
+    password_hash_wait,
+)
 from fastapi_zero.models import User
+from fastapi_zero.profiling import profile_span
+from fastapi_zero.revocation import revoked_tokens
 from fastapi_zero.settings import Settings
+from fastapi_zero.singleflight import user_lookups
 
-pwd_context = PasswordHash.recommended()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/token')
 settings = Settings()
+# hashes made with other parameters still verify, and report that they
+# need a rehash
+pwd_context = PasswordHash((
+    Argon2Hasher(
+        time_cost=settings.ARGON2_TIME_COST,
+        memory_cost=settings.ARGON2_MEMORY_COST,
+        parallelism=settings.ARGON2_PARALLELISM,
+    ),
+))
+
+
+@dataclass
+class HashStats:
+    in_flight: int = 0
+    completed: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+    @property
+    def queue_depth(self):
+        return max(0, self.in_flight - settings.PASSWORD_HASH_WORKERS)
+
+    def record_wait(self, wait_seconds: float):
+        self.completed += 1
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+hash_stats = HashStats()
+user_cache = TTLCache(
+    maxsize=settings.USER_CACHE_MAXSIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+# per user id, part of the key of shared lookups by id
+user_row_generations = Generations(settings.USER_CACHE_MAXSIZE)
+_hash_executor: Executor | None = None
+
+REGISTRY.register(
+    Gauge(
+        'password_hash_queue_depth',
+        'Password hashes waiting for an executor worker.',
+        function=lambda: hash_stats.queue_depth,
+    )
+)
+REGISTRY.register(
+    Gauge(
+        'user_cache_hits',
+        'Authenticated user cache hits.',
+        function=lambda: user_cache.hits,
+    )
+)
+REGISTRY.register(
+    Gauge(
+        'user_cache_misses',
+        'Authenticated user cache misses.',
+        function=lambda: user_cache.misses,
+    )
+)
+
+
+def get_hash_executor() -> Executor:
+    global _hash_executor  # noqa: PLW0603
+
+    if _hash_executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == 'process':
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS
+            )
+        else:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                thread_name_prefix='password-hash',
+            )
+
+    return _hash_executor
+
+
+def shutdown_hash_executor():
+    global _hash_executor  # noqa: PLW0603
+
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+        _hash_executor = None
 
 
 def get_password_hash(password: str):
@@ -26,19 +129,115 @@ def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _timed_call(func, submitted_at: float, *args):
+    # monotonic is system-wide on Linux, so this also holds for processes
+    wait_seconds = time.monotonic() - submitted_at
+    return wait_seconds, func(*args)
+
+
+async def _run_in_hash_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    submitted_at = time.monotonic()
+    hash_stats.in_flight += 1
+    try:
+        with profile_span('argon2', func.__name__):
+            wait_seconds, result = await loop.run_in_executor(
+                get_hash_executor(), _timed_call, func, submitted_at, *args
+            )
+    finally:
+        hash_stats.in_flight -= 1
+
+    hash_stats.record_wait(wait_seconds)
+    password_hash_wait.observe(wait_seconds)
+    password_hash_duration.observe(
+        time.monotonic() - submitted_at - wait_seconds, (func.__name__,)
+    )
+    return result
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_in_hash_executor(get_password_hash, password)
+
+
+async def verify_password_async(
+    plain_password: str, hashed_password: str
+) -> bool:
+    return await _run_in_hash_executor(
+        verify_password, plain_password, hashed_password
+    )
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    return await _run_in_hash_executor(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
+
 def create_acess_token(data: dict):
     to_encode = data.copy()
 
     expire = datetime.now(tz=ZoneInfo('UTC')) + timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
-    to_encode.update({'exp': expire})
+    to_encode.update({'exp': expire, 'jti': uuid4().hex})
+
+    return encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def create_refresh_token(subject: str, jti: str, expire: datetime):
+    to_encode = {'sub': subject, 'jti': jti, 'type': 'refresh', 'exp': expire}
 
     return encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+def decode_refresh_token(token: str) -> dict:
+    payload = decode(token, settings.SECRET_KEY, algorithms=settings.ALGORITHM)
+    if payload.get('type') != 'refresh' or not payload.get('jti'):
+        raise InvalidTokenError('Not a refresh token')
+
+    return payload
+
+
+async def fetch_user_row(bind, criterion):
+    # runs on its own session: the result may be shared by many requests,
+    # so it must not depend on any one request's session staying open
+    async with AsyncSession(bind) as session:
+        return (
+            await session.execute(select(User.__table__).where(criterion))
+        ).first()
+
+
+async def _user_from_snapshot(session: AsyncSession, snapshot: dict) -> User:
+    user = User(
+        username=snapshot['username'],
+        email=snapshot['email'],
+        password=snapshot['password'],
+    )
+    user.id = snapshot['id']
+    user.created_at = snapshot['created_at']
+    user.updated_at = snapshot['updated_at']
+    make_transient_to_detached(user)
+
+    return await session.merge(user, load=False)
+
+
+def invalidate_cached_user(email: str):
+    user_cache.pop(email)
+
+
+def invalidate_user_row(user_id: int):
+    # a lookup by id that started before the write is not joined any more
+    user_row_generations.bump(user_id)
+
+
 async def get_current_user(
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     token: str = Depends(oauth2_scheme),
 ):
     credentials_exception = HTTPException(
@@ -52,16 +251,27 @@ async def get_current_user(
             token, settings.SECRET_KEY, algorithms=settings.ALGORITHM
         )
         subject_email = payload.get('sub')
-        if not subject_email:
+        if not subject_email or payload.get('type') == 'refresh':
             raise credentials_exception
-    except DecodeError:
+    except InvalidTokenError:
         raise credentials_exception
 
-    user = await session.scalar(
-        select(User).where(User.email == subject_email)
-    )
-
-    if not user:
+    if payload.get('jti') in revoked_tokens:
         raise credentials_exception
 
-    return user
+    snapshot = user_cache.get(subject_email)
+    if snapshot is None:
+        # a lookup started before an invalidation must neither be joined
+        # nor cached by the requests that come after it
+        generation = user_cache.generation(subject_email)
+        row = await user_lookups.do(
+            ('email', subject_email, generation),
+            partial(fetch_user_row, session.bind, User.email == subject_email),
+        )
+        if not row:
+            raise credentials_exception
+
+        snapshot = row._asdict()
+        user_cache.set(subject_email, snapshot, generation)
+
+    return await _user_from_snapshot(session, snapshot)
@@ -0,0 +1,36 @@
+from typing import Any, NotRequired, TypedDict, override
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+
+# key order is the output order, and matches UserPublic / UserList
+class UserRow(TypedDict):
+    username: str
+    email: str
+    id: int
+
+
+class UserPage(TypedDict):
+    users: list[UserRow]
+    next_cursor: NotRequired[str]
+
+
+user_adapter = TypeAdapter(UserRow)
+user_page_adapter = TypeAdapter(UserPage)
+
+
+def user_row(username: str, email: str, user_id: int) -> UserRow:
+    return {'username': username, 'email': email, 'id': user_id}
+
+
+class FastJSONResponse(Response):
+    media_type = 'application/json'
+
+    @override
+    def render(self, content: Any) -> bytes:
+        # bytes come from a precompiled serializer and go out untouched
+        if isinstance(content, bytes):
+            return content
+        return to_json(content)
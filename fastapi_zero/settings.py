@@ -1,3 +1,7 @@
+import os
+from typing import Literal
+
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,3 +14,86 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    REFRESH_TOKEN_EXPIRE_DAYS: int = Field(default=30, ge=1)
+    REVOCATION_SYNC_SECONDS: float = Field(default=5.0, ge=0)
+    TOKEN_PURGE_SECONDS: float = Field(default=3600.0, ge=0)
+
+    PASSWORD_HASH_EXECUTOR: Literal['thread', 'process'] = 'thread'
+    PASSWORD_HASH_WORKERS: int = Field(
+        default_factory=lambda: os.cpu_count() or 1, ge=1
+    )
+    # written by `python -m fastapi_zero.calibrate`, argon2 memory is in KiB
+    ARGON2_TIME_COST: int = Field(default=3, ge=1)
+    ARGON2_MEMORY_COST: int = Field(default=65536, ge=8)
+    ARGON2_PARALLELISM: int = Field(default=4, ge=1)
+
+    # admission control for the routes that run argon2
+    ADMISSION_MAX_CONCURRENCY: int = Field(
+        default_factory=lambda: 2 * (os.cpu_count() or 1), ge=1
+    )
+    ADMISSION_QUEUE_SIZE: int = Field(default=64, ge=0)
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = Field(default=2.0, gt=0)
+    RATE_LIMIT_PER_SECOND: float = Field(default=1.0, ge=0)
+    # every password hashed costs a token, so the burst is also the
+    # largest bulk import a client can send at once
+    RATE_LIMIT_BURST: int = Field(default=10, ge=1)
+    RATE_LIMIT_MAX_CLIENTS: int = Field(default=10_000, ge=1)
+
+    # request deadlines in seconds, 0 turns the deadline off for a route
+    REQUEST_TIMEOUT_SECONDS: float = Field(default=30.0, ge=0)
+    REQUEST_TIMEOUT_MAX_SECONDS: float = Field(default=60.0, gt=0)
+    # long imports commit chunk by chunk, so they run without a deadline
+    REQUEST_ROUTE_TIMEOUTS: dict[str, float] = {
+        '/users/export': 0,
+        '/users/bulk': 0,
+    }
+
+    USER_CACHE_MAXSIZE: int = 1024
+    # invalidation only reaches the worker that made the change, the others
+    # serve their copy until it expires; keep this near the revocation sync
+    USER_CACHE_TTL_SECONDS: float = 5.0
+
+    EXPORT_BATCH_SIZE: int = Field(default=1000, ge=1)
+
+    BULK_MAX_ITEMS: int = Field(default=5000, ge=1)
+    BULK_INSERT_BATCH_SIZE: int = Field(default=500, ge=1)
+    # hashes one import may run at once, the executor is shared with logins
+    BULK_HASH_CONCURRENCY: int = Field(default=2, ge=1)
+
+    GROUP_COMMIT_ENABLED: bool = False
+    GROUP_COMMIT_WINDOW_MS: float = Field(default=2.0, ge=0)
+    GROUP_COMMIT_MAX_BATCH: int = Field(default=64, ge=1)
+
+    DB_WRITER_POOL_SIZE: int = Field(default=1, ge=1)
+    DB_WRITER_MAX_OVERFLOW: int = Field(default=0, ge=0)
+    DB_READER_POOL_SIZE: int = Field(default=5, ge=1)
+    DB_READER_MAX_OVERFLOW: int = Field(default=10, ge=0)
+    DB_POOL_TIMEOUT_SECONDS: float = Field(default=30.0, gt=0)
+
+    SQLITE_JOURNAL_MODE: Literal[
+        'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'
+    ] = 'WAL'
+    SQLITE_SYNCHRONOUS: Literal['OFF', 'NORMAL', 'FULL', 'EXTRA'] = 'NORMAL'
+    SQLITE_CACHE_SIZE: int = -64000
+    SQLITE_MMAP_SIZE: int = Field(default=268435456, ge=0)
+    SQLITE_BUSY_TIMEOUT_MS: int = Field(default=5000, ge=0)
+
+    # profiling is off unless a sample rate or a signing secret is set
+    PROFILE_SAMPLE_RATE: float = Field(default=0.0, ge=0, le=1)
+    PROFILE_SECRET: str | None = None
+    PROFILE_FORMAT: Literal['pstats', 'collapsed'] = 'collapsed'
+    PROFILE_DIRECTORY: str = 'profiles'
+    PROFILE_SAMPLE_INTERVAL_MS: float = Field(default=1.0, gt=0)
+
+    # 0 turns the slow-query log off
+    SLOW_QUERY_THRESHOLD_MS: float = Field(default=100.0, ge=0)
+    SLOW_QUERY_LOG_SIZE: int = Field(default=100, ge=1)
+    ADMIN_TOKEN: str | None = None
+
+    DB_WARMUP_CONNECTIONS: int = Field(default=2, ge=0)
+    WEB_HOST: str = '127.0.0.1'
+    WEB_PORT: int = 8000
+    WEB_WORKERS: int = Field(default_factory=lambda: os.cpu_count() or 1, ge=1)
+
+    BATCH_LOOKUP_MAX_IDS: int = Field(default=5000, ge=1)
+    BATCH_LOOKUP_CHUNK_SIZE: int = Field(default=900, ge=1)
@@ -0,0 +1,58 @@
+import asyncio
+from contextvars import Context
+from typing import Awaitable, Callable, Hashable
+
+from fastapi_zero.metrics import REGISTRY, Gauge
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight: dict[Hashable, _Call] = {}
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._inflight.get(key) is call:
+            del self._inflight[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]):
+        call = self._inflight.get(key)
+
+        if call is None:
+            # a fresh context: the query serves every waiter, so it must not
+            # run under the deadline of whichever request happened to start it
+            call = _Call(asyncio.create_task(func(), context=Context()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self._inflight[key] = call
+            self.calls += 1
+        else:
+            self.shared += 1
+
+        call.waiters += 1
+        try:
+            # shielded so one cancelled caller does not fail the others
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # nobody is left to read the result; on SQLite the engine
+                # turns the cancellation into an interrupt of the statement
+                self._forget(key, call)
+                call.task.cancel()
+
+
+user_lookups = SingleFlight()
+
+REGISTRY.register(
+    Gauge(
+        'singleflight_saved_queries',
+        'User lookups answered by an identical in-flight query.',
+        function=lambda: user_lookups.shared,
+    )
+)
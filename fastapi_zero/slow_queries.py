@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import Context
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from fastapi_zero.cache import TTLCache
+from fastapi_zero.metrics import current_route
+from fastapi_zero.settings import Settings
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+logger = logging.getLogger(__name__)
+settings = Settings()
+
+
+def _redact_value(value) -> str:
+    return f'<{type(value).__name__}>'
+
+
+def redact(parameters):
+    if isinstance(parameters, dict):
+        return {
+            name: _redact_value(value) for name, value in parameters.items()
+        }
+    if isinstance(parameters, list):
+        # executemany: the shape of one row is enough
+        return {'rows': len(parameters), 'first': redact(parameters[0])}
+    return [_redact_value(value) for value in parameters or ()]
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, maxlen: int):
+        self.threshold_ms = threshold_ms
+        self.entries: deque[dict] = deque(maxlen=maxlen)
+        # a plan per statement text is enough, the same slow query
+        # repeating should not keep hitting the side connection
+        self._plans = TTLCache(maxsize=256, ttl=300)
+        self._pending: set[asyncio.Task] = set()
+        self._explain_engines: list[AsyncEngine] = []
+
+    def attach(self, engine: AsyncEngine, explain: bool = True):
+        sync_engine = engine.sync_engine
+        # EXPLAIN gets connections of its own: borrowing from the engine
+        # could wait on, or starve, a writer pool of one; an in-memory
+        # database has no tables on any other connection, so no EXPLAIN
+        explain_engine = None
+        if explain:
+            explain_engine = create_async_engine(
+                engine.url, poolclass=NullPool
+            )
+            self._explain_engines.append(explain_engine)
+
+        def after_cursor_execute(conn, cursor, statement, parameters, *args):
+            started_at = conn.info.pop('slow_query_started_at', None)
+            if started_at is not None:
+                self._check(
+                    explain_engine,
+                    statement,
+                    parameters,
+                    (time.perf_counter() - started_at) * 1000,
+                )
+
+        def handle_error(context):
+            # failed and interrupted statements tend to be the slowest ones
+            if context.connection is None:
+                return
+            started_at = context.connection.info.pop(
+                'slow_query_started_at', None
+            )
+            if started_at is not None:
+                self._check(
+                    explain_engine,
+                    context.statement,
+                    context.parameters,
+                    (time.perf_counter() - started_at) * 1000,
+                    error=type(context.original_exception).__name__,
+                )
+
+        event.listen(sync_engine, 'before_cursor_execute', _start_timer)
+        event.listen(sync_engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(sync_engine, 'handle_error', handle_error)
+
+    def _check(  # noqa: PLR0913, PLR0917
+        self, engine, statement, parameters, duration_ms, error=None
+    ):
+        if duration_ms < self.threshold_ms:
+            return
+
+        entry = {
+            'statement': statement,
+            'parameters': redact(parameters),
+            'duration_ms': round(duration_ms, 3),
+            'route': current_route(),
+            'plan': self._plans.get(statement),
+            'error': error,
+            'recorded_at': datetime.now(tz=ZoneInfo('UTC')),
+        }
+        self.entries.append(entry)
+        logger.warning(
+            'Slow query (%.1fms%s) on %s: %s %s',
+            duration_ms,
+            f', {error}' if error else '',
+            entry['route'] or '-',
+            statement,
+            entry['parameters'],
+        )
+
+        if (
+            engine is not None
+            and entry['plan'] is None
+            and statement.lstrip().upper().startswith(EXPLAINABLE)
+        ):
+            # outlives the request, so it gets none of its deadline
+            task = asyncio.get_running_loop().create_task(
+                self._explain(engine, entry, parameters), context=Context()
+            )
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _explain(self, engine: AsyncEngine, entry: dict, parameters):
+        prefix = (
+            'EXPLAIN QUERY PLAN'
+            if engine.dialect.name == 'sqlite'
+            else 'EXPLAIN'
+        )
+        if isinstance(parameters, list):
+            parameters = parameters[0]
+
+        try:
+            async with engine.connect() as conn:
+                result = await conn.exec_driver_sql(
+                    f'{prefix} {entry["statement"]}', parameters or ()
+                )
+                plan = [
+                    ' '.join(str(column) for column in row) for row in result
+                ]
+        except SQLAlchemyError as exc:
+            plan = [f'EXPLAIN failed: {getattr(exc, "orig", None) or exc}']
+
+        entry['plan'] = plan
+        self._plans.set(entry['statement'], plan)
+        logger.warning(
+            'Plan for slow query %s: %s', entry['statement'], '; '.join(plan)
+        )
+
+    async def drain(self):
+        while self._pending:
+            await asyncio.gather(*self._pending)
+
+    async def dispose(self):
+        await self.drain()
+        for engine in self._explain_engines:
+            await engine.dispose()
+        self._explain_engines.clear()
+
+    def clear(self):
+        self.entries.clear()
+        self._plans.clear()
+
+
+def _start_timer(conn, cursor, statement, parameters, context, _):
+    if context is None or context.execution_options.get(
+        'slow_query_log', True
+    ):
+        conn.info['slow_query_started_at'] = time.perf_counter()
+
+
+slow_queries = SlowQueryLog(
+    settings.SLOW_QUERY_THRESHOLD_MS, settings.SLOW_QUERY_LOG_SIZE
+)
@@ -0,0 +1,55 @@
+"""add user search indexes
+
+Revision ID: 5b2d8e41c7a9
+Revises: 013a0a74a250
+Create Date: 2026-10-18 20:45:12.481903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2d8e41c7a9'
+down_revision: Union[str, None] = '013a0a74a250'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+USERS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE users_fts USING fts5(username, email, content='users', content_rowid='id', prefix='2 3')",
+    'CREATE TRIGGER users_fts_ai AFTER INSERT ON users BEGIN INSERT INTO users_fts(rowid, username, email) VALUES (new.id, new.username, new.email); END',
+    "CREATE TRIGGER users_fts_ad AFTER DELETE ON users BEGIN INSERT INTO users_fts(users_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email); END",
+    "CREATE TRIGGER users_fts_au AFTER UPDATE OF username, email ON users BEGIN INSERT INTO users_fts(users_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email); INSERT INTO users_fts(rowid, username, email) VALUES (new.id, new.username, new.email); END",
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # FTS5 and the instr() expression index only exist on SQLite, the
+    # models skip them elsewhere as well
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.create_index(
+        'ix_users_email_domain',
+        'users',
+        [sa.text("lower(substr(email, instr(email, '@') + 1))")],
+        unique=False,
+    )
+    for statement in USERS_FTS_DDL:
+        op.execute(statement)
+    op.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute('DROP TRIGGER IF EXISTS users_fts_au')
+    op.execute('DROP TRIGGER IF EXISTS users_fts_ad')
+    op.execute('DROP TRIGGER IF EXISTS users_fts_ai')
+    op.execute('DROP TABLE IF EXISTS users_fts')
+    op.drop_index('ix_users_email_domain', table_name='users')
@@ -0,0 +1,45 @@
+"""never reuse revoked token ids
+
+Revision ID: f3a6c0d81b27
+Revises: d7e3b9a05f12
+Create Date: 2026-10-18 23:12:40.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a6c0d81b27'
+down_revision: Union[str, None] = 'd7e3b9a05f12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # other databases draw ids from a sequence, which never goes backwards
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    with op.batch_alter_table(
+        'revoked_tokens',
+        recreate='always',
+        table_kwargs={'sqlite_autoincrement': True},
+    ):
+        pass
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    with op.batch_alter_table(
+        'revoked_tokens',
+        recreate='always',
+        table_kwargs={'sqlite_autoincrement': False},
+    ):
+        pass
@@ -1,49 +1,123 @@
+import os
+import time
 from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
 
-import factory
+# argon2 at its minimum cost, read by Settings when fastapi_zero.security
+# builds its hasher; a real deployment keeps the calibrated costs
+os.environ.setdefault('ARGON2_TIME_COST', '1')
+os.environ.setdefault('ARGON2_MEMORY_COST', '8')
+os.environ.setdefault('ARGON2_PARALLELISM', '1')
+
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import event
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
+from fastapi_zero.admission import client_buckets, hash_limiter
 from fastapi_zero.app import app
-from fastapi_zero.database import get_session
-from fastapi_zero.models import User, table_registry
-from fastapi_zero.security import get_password_hash
+from fastapi_zero.database import get_read_session, get_session
+from fastapi_zero.models import table_registry
+from fastapi_zero.revocation import revoked_tokens
+from fastapi_zero.security import get_password_hash, user_cache
 from fastapi_zero.settings import Settings
+from tests.factories import UserFactory
 
 
 @pytest.fixture
-def client(session):
+def client(session, monkeypatch):
     def get_session_override():
         return session
 
+    # the lifespan engines stay unused, the session fixture serves requests
+    monkeypatch.setenv('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    monkeypatch.setenv('DB_WARMUP_CONNECTIONS', '0')
+    monkeypatch.setenv('REVOCATION_SYNC_SECONDS', '0')
+
     with TestClient(app) as client:
         app.dependency_overrides[get_session] = get_session_override
+        app.dependency_overrides[get_read_session] = get_session_override
         yield client
 
     app.dependency_overrides.clear()
-
-
-@pytest_asyncio.fixture
-async def session():
+    user_cache.clear()
+    revoked_tokens.clear()
+    client_buckets.clear()
+    hash_limiter.clear()
+
+
+HARNESS_STATEMENTS = (
+    'SAVEPOINT',
+    'RELEASE SAVEPOINT',
+    'ROLLBACK TO SAVEPOINT',
+)
+
+
+def _begin_explicitly(engine):
+    # pysqlite defers BEGIN until the first DML, which breaks SAVEPOINTs
+    @event.listens_for(engine, 'connect')
+    def disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+
+@pytest.fixture(scope='session')
+def engine(tmp_path_factory, request):
+    # one database file per xdist worker, the schema is created once;
+    # without xdist the whole run shares a single file
+    workerinput = getattr(request.config, 'workerinput', {})
+    worker_id = workerinput.get('workerid', 'main')
+    path = tmp_path_factory.mktemp('db') / f'test_{worker_id}.db'
+
+    sync_engine = create_engine(f'sqlite:///{path}')
+    table_registry.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    # NullPool: every test runs on its own event loop, so no connection
+    # may outlive it
     engine = create_async_engine(
-        'sqlite+aiosqlite:///:memory:',
-        connect_args={'check_same_thread': False},
-        poolclass=StaticPool,
+        f'sqlite+aiosqlite:///{path}', poolclass=NullPool
     )
+    _begin_explicitly(engine.sync_engine)
+
+    return engine
 
-    async with engine.begin() as conn:
-        await conn.run_sync(table_registry.metadata.create_all)
 
-    async with AsyncSession(engine, expire_on_commit=False) as session:
-        yield session
+@pytest_asyncio.fixture
+async def session(engine):
+    # everything a test commits lands in a SAVEPOINT of one outer
+    # transaction, which is rolled back afterwards
+    async with engine.connect() as conn:
+        await conn.begin()
+        async with AsyncSession(
+            bind=conn,
+            expire_on_commit=False,
+            join_transaction_mode='create_savepoint',
+        ) as session:
+            yield session
+        await conn.rollback()
 
-    async with engine.begin() as conn:
-        await conn.run_sync(table_registry.metadata.drop_all)
+
+@pytest_asyncio.fixture
+async def writer_session(client, session):
+    # get_session gets a session of its own, so a test can tell the writer
+    # apart from the reads; both still share the rolled back connection
+    async with AsyncSession(
+        bind=session.bind,
+        expire_on_commit=False,
+        join_transaction_mode='create_savepoint',
+    ) as writer:
+        app.dependency_overrides[get_session] = lambda: writer
+        yield writer
 
 
 @contextmanager
@@ -62,6 +136,99 @@ def _mock_db_time(model, time=datetime(2025, 5, 22)):
     event.remove(model, 'before_insert', fake_time_hook)
 
 
+@dataclass
+class CapturedStatement:
+    statement: str
+    parameters: object
+    seconds: float = 0.0
+
+
+class StatementRecorder:
+    def __init__(self, engine):
+        self.engine = engine
+        self.captured: list[CapturedStatement] = []
+        # a plain list of SQL strings, for tests that only look at the text
+        self.statements: list[str] = []
+
+    def _before(self, conn, cursor, statement, parameters, *args):
+        # the harness turns commits and rollbacks into SAVEPOINT statements,
+        # outside of tests those never reach the cursor
+        if statement.startswith(HARNESS_STATEMENTS):
+            return
+
+        self.captured.append(CapturedStatement(statement, parameters))
+        self.statements.append(statement)
+        conn.info['recorded_at'] = time.perf_counter()
+
+    def _after(self, conn, *args):
+        started_at = conn.info.pop('recorded_at', None)
+        if started_at is not None:
+            self.captured[-1].seconds = time.perf_counter() - started_at
+
+    @property
+    def total_seconds(self):
+        return sum(captured.seconds for captured in self.captured)
+
+    def clear(self):
+        self.captured.clear()
+        self.statements.clear()
+
+    def report(self) -> str:
+        return '\n'.join(
+            f'{captured.seconds * 1000:8.2f}ms  {captured.statement}  '
+            f'{captured.parameters!r}'
+            for captured in self.captured
+        )
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before)
+        event.listen(self.engine, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._before)
+        event.remove(self.engine, 'after_cursor_execute', self._after)
+
+
+@pytest.fixture
+def statements(session):
+    with StatementRecorder(session.bind.sync_engine) as recorder:
+        yield recorder.statements
+
+
+@pytest.fixture
+def sql_budget(session):
+    @contextmanager
+    def budget(max_statements: int | None = None, max_ms: float | None = None):
+        with StatementRecorder(session.bind.sync_engine) as recorder:
+            yield recorder
+
+        problems = []
+        if max_statements is not None and (
+            len(recorder.captured) > max_statements
+        ):
+            problems.append(
+                f'{len(recorder.captured)} statements, '
+                f'budget is {max_statements}'
+            )
+        # time spent in SQL, not the wall time of the whole request
+        if max_ms is not None and recorder.total_seconds * 1000 > max_ms:
+            problems.append(
+                f'{recorder.total_seconds * 1000:.2f}ms of SQL, '
+                f'budget is {max_ms}ms'
+            )
+
+        if problems:
+            pytest.fail(
+                'SQL budget exceeded: {}\n{}'.format(
+                    '; '.join(problems), recorder.report()
+                ),
+                pytrace=False,
+            )
+
+    return budget
+
+
 @pytest.fixture
 def mock_db_time():
     return _mock_db_time
@@ -106,12 +273,3 @@ def token(client, user):
 @pytest.fixture
 def settings():
     return Settings()
-
-
-class UserFactory(factory.Factory):
-    class Meta:
-        model = User
-
-    username = factory.Sequence(lambda n: f'test{n}')
-    email = factory.LazyAttribute(lambda obj: f'{obj.username}@test.com')
-    password = factory.LazyAttribute(lambda obj: f'{obj.username}password')
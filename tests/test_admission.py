@@ -0,0 +1,133 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+from fastapi_zero import admission
+from fastapi_zero.admission import AdmissionLimiter, ClientBuckets, Overloaded
+
+
+def test_bucket_allows_a_burst_then_limits():
+    buckets = ClientBuckets(rate=1.0, burst=2, max_clients=10)
+
+    assert buckets.consume('a') == 0
+    assert buckets.consume('a') == 0
+    assert buckets.consume('a') == pytest.approx(1.0, abs=0.01)
+    assert buckets.consume('b') == 0
+
+
+def test_bucket_charges_the_cost():
+    buckets = ClientBuckets(rate=1.0, burst=5, max_clients=10)
+
+    assert buckets.consume('a', 4) == 0
+    assert buckets.consume('a', 3) == pytest.approx(2.0, abs=0.01)
+    assert buckets.consume('a') == 0
+
+
+def test_bucket_disabled_without_rate():
+    buckets = ClientBuckets(rate=0, burst=1, max_clients=10)
+
+    assert all(buckets.consume('a') == 0 for _ in range(5))
+
+
+@pytest.mark.asyncio
+async def test_limiter_queues_then_hands_over_slot():
+    limiter = AdmissionLimiter(limit=1, queue_size=1, queue_timeout=1)
+    await limiter.acquire()
+
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.queued == 1
+
+    limiter.release()
+    await waiting
+
+    assert limiter.active == 1
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_sheds_when_queue_is_full():
+    limiter = AdmissionLimiter(limit=1, queue_size=0, queue_timeout=1)
+    await limiter.acquire()
+
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+
+
+@pytest.mark.asyncio
+async def test_limiter_sheds_after_queue_timeout():
+    limiter = AdmissionLimiter(limit=1, queue_size=1, queue_timeout=0.01)
+    await limiter.acquire()
+
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+
+    assert limiter.queued == 0
+    limiter.release()
+    assert limiter.active == 0
+
+
+def test_token_route_is_rate_limited(client, user, monkeypatch):
+    monkeypatch.setattr(
+        admission,
+        'client_buckets',
+        ClientBuckets(rate=0.01, burst=1, max_clients=10),
+    )
+    data = {'username': user.email, 'password': user.clean_password}
+
+    assert client.post('/auth/token', data=data).status_code == HTTPStatus.OK
+    response = client.post('/auth/token', data=data)
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response.headers['Retry-After']) >= 1
+    assert admission.requests_shed.value(('/auth/token', 'rate_limit')) >= 1
+
+
+def test_signup_is_shed_when_overloaded(client, monkeypatch):
+    monkeypatch.setattr(
+        admission,
+        'hash_limiter',
+        AdmissionLimiter(limit=0, queue_size=0, queue_timeout=1),
+    )
+
+    response = client.post(
+        '/users/',
+        json={'username': 'a', 'email': 'a@a.com', 'password': 'secret'},
+    )
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_reads_are_not_admission_controlled(client, user, monkeypatch):
+    monkeypatch.setattr(
+        admission,
+        'hash_limiter',
+        AdmissionLimiter(limit=0, queue_size=0, queue_timeout=1),
+    )
+
+    response = client.get(f'/users/{user.id}')
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_bulk_import_is_charged_per_password(client, token, monkeypatch):
+    monkeypatch.setattr(
+        admission,
+        'client_buckets',
+        ClientBuckets(rate=0.01, burst=3, max_clients=10),
+    )
+    users = [
+        {'username': f'u{i}', 'email': f'u{i}@a.com', 'password': 'secret'}
+        for i in range(4)
+    ]
+
+    response = client.post(
+        '/users/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=users,
+    )
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert admission.requests_shed.value(('/users/bulk', 'rate_limit')) >= 1
@@ -1,4 +1,14 @@
+from datetime import datetime, timedelta
 from http import HTTPStatus
+from zoneinfo import ZoneInfo
+
+import pytest
+from pwdlib.hashers.argon2 import Argon2Hasher
+from sqlalchemy import select
+
+from fastapi_zero.models import RefreshToken
+from fastapi_zero.routers import auth as auth_router
+from fastapi_zero.security import create_refresh_token, verify_password
 
 
 def test_get_token(client, user):
@@ -10,3 +20,247 @@ def test_get_token(client, user):
     assert response.status_code == HTTPStatus.OK
     assert token['token_type'] == 'Bearer'
     assert 'access_token' in token
+    assert 'refresh_token' in token
+
+
+def _login(client, user):
+    return client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    ).json()
+
+
+def test_refresh_token_issues_new_tokens(client, user):
+    tokens = _login(client, user)
+
+    response = client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': tokens['refresh_token']},
+    )
+    refreshed = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert refreshed['token_type'] == 'Bearer'
+    assert refreshed['refresh_token'] != tokens['refresh_token']
+
+    response = client.get(
+        '/users/',
+        headers={'Authorization': f'Bearer {refreshed["access_token"]}'},
+    )
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_refresh_token_is_single_use(client, user):
+    tokens = _login(client, user)
+    client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': tokens['refresh_token']},
+    )
+
+    response = client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': tokens['refresh_token']},
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Invalid refresh token'}
+
+
+def test_refresh_token_reuse_revokes_rotated_tokens(client, user):
+    tokens = _login(client, user)
+    rotated = client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': tokens['refresh_token']},
+    ).json()
+    client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': tokens['refresh_token']},
+    )
+
+    response = client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': rotated['refresh_token']},
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_refresh_token_skips_password_hashing(client, user, monkeypatch):
+    tokens = _login(client, user)
+
+    async def fail(*args):
+        raise AssertionError('password verified on refresh')
+
+    monkeypatch.setattr(
+        'fastapi_zero.routers.auth.verify_and_update_password_async', fail
+    )
+    response = client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': tokens['refresh_token']},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_must_match_its_user(client, session, user):
+    expire = datetime.now(tz=ZoneInfo('UTC')) + timedelta(days=1)
+    session.add(RefreshToken(jti='stale', user_id=user.id, expires_at=expire))
+    await session.commit()
+
+    response = client.post(
+        '/auth/refresh_token',
+        json={
+            'refresh_token': create_refresh_token(
+                'deleted@example.com', 'stale', expire
+            )
+        },
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Invalid refresh token'}
+
+
+@pytest.mark.asyncio
+async def test_deleting_user_drops_refresh_tokens(
+    client, session, user, token
+):
+    _login(client, user)
+
+    client.delete(
+        f'/users/{user.id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    remaining = await session.scalars(select(RefreshToken.jti))
+    assert remaining.all() == []
+
+
+def test_access_token_is_not_a_refresh_token(client, token):
+    response = client.post(
+        '/auth/refresh_token', json={'refresh_token': token}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_refresh_token_is_not_an_access_token(client, user):
+    tokens = _login(client, user)
+
+    response = client.get(
+        '/users/',
+        headers={'Authorization': f'Bearer {tokens["refresh_token"]}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_logout_revokes_access_token(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+
+    response = client.post('/auth/logout', headers=headers)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'message': 'Logged out'}
+    assert client.get('/users/', headers=headers).status_code == (
+        HTTPStatus.UNAUTHORIZED
+    )
+
+
+def test_logout_revokes_refresh_token(client, user):
+    tokens = _login(client, user)
+
+    client.post(
+        '/auth/logout',
+        headers={'Authorization': f'Bearer {tokens["access_token"]}'},
+        json={'refresh_token': tokens['refresh_token']},
+    )
+    response = client.post(
+        '/auth/refresh_token',
+        json={'refresh_token': tokens['refresh_token']},
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_logout_keeps_other_sessions(client, user):
+    first = _login(client, user)
+    second = _login(client, user)
+
+    client.post(
+        '/auth/logout',
+        headers={'Authorization': f'Bearer {first["access_token"]}'},
+    )
+    response = client.get(
+        '/users/',
+        headers={'Authorization': f'Bearer {second["access_token"]}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password(
+    client, session, user, settings
+):
+    legacy = Argon2Hasher(time_cost=2, memory_cost=64, parallelism=1)
+    user.password = legacy.hash(user.clean_password)
+    await session.commit()
+    await session.refresh(user)
+    updated_at = user.updated_at
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+
+    await session.refresh(user)
+    assert response.status_code == HTTPStatus.OK
+    assert user.password.startswith(
+        f'$argon2id$v=19$m={settings.ARGON2_MEMORY_COST},'
+        f't={settings.ARGON2_TIME_COST},p={settings.ARGON2_PARALLELISM}$'
+    )
+    assert user.updated_at == updated_at
+    assert verify_password(user.clean_password, user.password)
+
+
+def test_login_sql_budget(client, user, sql_budget):
+    with sql_budget(max_statements=2, max_ms=50):
+        response = client.post(
+            '/auth/token',
+            data={'username': user.email, 'password': user.clean_password},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_refresh_token_sql_budget(client, user, sql_budget):
+    tokens = _login(client, user)
+
+    with sql_budget(max_statements=3, max_ms=50):
+        response = client.post(
+            '/auth/refresh_token',
+            json={'refresh_token': tokens['refresh_token']},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_login_hashes_outside_the_writer_transaction(
+    client, writer_session, user, monkeypatch
+):
+    verify = auth_router.verify_and_update_password_async
+    writer_busy = []
+
+    async def spy(password, hashed):
+        writer_busy.append(writer_session.in_transaction())
+        return await verify(password, hashed)
+
+    monkeypatch.setattr(auth_router, 'verify_and_update_password_async', spy)
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert writer_busy == [False]
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from benchmarks.load import SCENARIOS, Workload, compare, percentile, summarize
+
+
+def _report(p95_ms, rps):
+    return {'results': {'read_user': {'p95_ms': p95_ms, 'rps': rps}}}
+
+
+def test_percentile():
+    samples = [float(value) for value in range(1, 101)]
+
+    assert percentile(samples, 0.50) == 50.0  # noqa: PLR2004
+    assert percentile(samples, 0.99) == 99.0  # noqa: PLR2004
+    assert percentile([7.0], 0.95) == 7.0  # noqa: PLR2004
+
+
+def test_summarize_counts_errors():
+    summary = summarize([0.01, 0.02], errors=2, elapsed=1.0)
+
+    assert summary['requests'] == 4  # noqa: PLR2004
+    assert summary['errors'] == 2  # noqa: PLR2004
+    assert summary['rps'] == 4.0  # noqa: PLR2004
+
+
+def test_compare_within_threshold():
+    assert compare(_report(10, 100), _report(10.5, 95), threshold=0.1) == []
+
+
+def test_compare_flags_regressions():
+    regressions = compare(_report(10, 100), _report(20, 50), threshold=0.1)
+
+    assert len(regressions) == 2  # noqa: PLR2004
+    assert regressions[0].startswith('read_user: p95')
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.urls = []
+
+    async def get(self, url, **kwargs):
+        self.urls.append(url)
+
+
+async def _list_offsets(seed):
+    client = _RecordingClient()
+    workload = Workload(
+        users=[{'id': 1, 'headers': {}}],
+        seeded=100_000,
+        rng=random.Random(seed),
+    )
+
+    for _ in range(20):
+        await SCENARIOS['list_users'](client, workload, workload.users[0])
+
+    return [int(url.split('offset=')[1].split('&')[0]) for url in client.urls]
+
+
+@pytest.mark.asyncio
+async def test_list_offsets_span_the_seeded_table():
+    offsets = await _list_offsets(seed=1)
+
+    assert max(offsets) > 1000  # noqa: PLR2004
+    assert max(offsets) <= 100_000 - 10
+    assert offsets == await _list_offsets(seed=1)
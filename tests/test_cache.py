@@ -0,0 +1,50 @@
+from fastapi_zero.cache import TTLCache
+
+
+def test_cache_counts_hits_and_misses():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 'first')
+    cache.set('b', 'second')
+    cache.get('a')
+    cache.set('c', 'third')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'first'
+    assert cache.get('c') == 'third'
+
+
+def test_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0)
+    cache.set('a', 1)
+
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cache_pop():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+
+    assert cache.pop('a') == 1
+    assert cache.pop('a') is None
+
+
+def test_cache_skips_values_read_before_an_invalidation():
+    cache = TTLCache(maxsize=2, ttl=60)
+    generation = cache.generation('a')
+    cache.pop('a')
+
+    cache.set('a', 'stale', generation)
+    assert cache.get('a') is None
+
+    cache.set('a', 'fresh', cache.generation('a'))
+    assert cache.get('a') == 'fresh'
@@ -0,0 +1,41 @@
+from fastapi_zero.calibrate import calibrate, main, write_env
+
+
+def fake_measure(time_cost, memory_cost, parallelism):
+    # 1ms per pass per MiB
+    return time_cost * memory_cost / 1024 / 1000
+
+
+def test_calibrate_spends_the_budget_on_passes():
+    result = calibrate(0.25, 64 * 1024, 2, measure=fake_measure)
+
+    assert result['ARGON2_MEMORY_COST'] == 64 * 1024
+    assert result['ARGON2_TIME_COST'] == 3  # noqa: PLR2004
+    assert result['ARGON2_PARALLELISM'] == 2  # noqa: PLR2004
+    assert result['seconds'] <= 0.25  # noqa: PLR2004
+
+
+def test_calibrate_lowers_memory_for_tight_targets():
+    result = calibrate(0.02, 64 * 1024, 1, measure=fake_measure)
+
+    assert result['ARGON2_MEMORY_COST'] == 16 * 1024
+    assert result['ARGON2_TIME_COST'] == 1
+
+
+def test_write_env_replaces_existing_values(tmp_path):
+    env = tmp_path / '.env'
+    env.write_text('SECRET_KEY=secret\nARGON2_TIME_COST=9\n')
+
+    write_env(env, {'ARGON2_TIME_COST': 2, 'ARGON2_MEMORY_COST': 8192})
+
+    assert env.read_text() == (
+        'SECRET_KEY=secret\nARGON2_TIME_COST=2\nARGON2_MEMORY_COST=8192\n'
+    )
+
+
+def test_main_prints_settings(capsys):
+    main(['--target-ms', '1', '--max-memory-mib', '8', '--parallelism', '1'])
+
+    out = capsys.readouterr().out
+    assert 'ARGON2_TIME_COST=1\n' in out
+    assert 'ARGON2_MEMORY_COST=8192\n' in out
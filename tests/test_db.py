@@ -1,10 +1,17 @@
 from dataclasses import asdict
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import event, select, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi_zero.models import User
+from fastapi_zero import database
+from fastapi_zero.database import create_database_engine
+from fastapi_zero.models import User, table_registry
+from fastapi_zero.pagination import encode_cursor
+from fastapi_zero.routers.users import read_users
+from fastapi_zero.schemas import FilterPage
+from fastapi_zero.security import fetch_user_row
 
 
 @pytest.mark.asyncio
@@ -29,3 +36,69 @@ async def test_create_user(session: AsyncSession, mock_db_time):
         'created_at': time,
         'updated_at': time,
     }
+
+
+@pytest.mark.asyncio
+async def test_engines_apply_sqlite_pragmas(tmp_path, settings):
+    settings.DATABASE_URL = f'sqlite+aiosqlite:///{tmp_path}/db.sqlite'
+    writer = create_database_engine(settings)
+    reader = create_database_engine(settings, readonly=True)
+
+    async with writer.connect() as conn:
+        journal_mode = await conn.scalar(text('PRAGMA journal_mode'))
+        busy_timeout = await conn.scalar(text('PRAGMA busy_timeout'))
+
+    async with reader.connect() as conn:
+        query_only = await conn.scalar(text('PRAGMA query_only'))
+        with pytest.raises(OperationalError):
+            await conn.execute(text('CREATE TABLE t (id INTEGER)'))
+
+    await writer.dispose()
+    await reader.dispose()
+
+    assert journal_mode == settings.SQLITE_JOURNAL_MODE.lower()
+    assert busy_timeout == settings.SQLITE_BUSY_TIMEOUT_MS
+    assert query_only == 1
+    assert reader.pool.size() == settings.DB_READER_POOL_SIZE
+
+
+@pytest.mark.asyncio
+async def test_warmup_database_fills_the_pools(tmp_path, settings):
+    settings.DATABASE_URL = f'sqlite+aiosqlite:///{tmp_path}/db.sqlite'
+    database.init_database(settings)
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    await database.warmup_database(connections=2)
+    reader_connections = database.reader_engine.pool.checkedin()
+
+    await database.dispose_database()
+
+    assert reader_connections == 2  # noqa: PLR2004
+    assert database.engine is None
+
+
+@pytest.mark.asyncio
+async def test_warmup_covers_the_hot_paths(tmp_path, settings):
+    settings.DATABASE_URL = f'sqlite+aiosqlite:///{tmp_path}/db.sqlite'
+    engine = create_database_engine(settings)
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+    await database._warmup_connection(engine)
+    cache_hits = []
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, _):
+        cache_hits.append(context.cache_hit == context.dialect.CACHE_HIT)
+
+    await fetch_user_row(engine, User.email == 'alice@example.com')
+    await fetch_user_row(engine, User.id == 1)
+    async with AsyncSession(engine) as session:
+        await read_users(session, None, FilterPage(limit=1))
+        await read_users(
+            session, None, FilterPage(limit=1, cursor=encode_cursor(0))
+        )
+    await engine.dispose()
+
+    assert cache_hits == [True] * 4
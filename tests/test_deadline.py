@@ -0,0 +1,154 @@
+import asyncio
+import time
+from http import HTTPStatus
+from typing import Annotated
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from fastapi_zero import deadline
+from fastapi_zero.deadline import (
+    DeadlineMiddleware,
+    enforce_deadlines,
+    request_deadline,
+)
+from fastapi_zero.singleflight import SingleFlight
+
+SLOW_QUERY = text(
+    'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c '
+    'WHERE x < 100000000) SELECT count(*) FROM c'
+)
+
+
+def _scope(path, headers=()):
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'headers': list(headers),
+    }
+
+
+@pytest.fixture
+def slow_app():
+    slow_app = FastAPI()
+    slow_app.add_middleware(DeadlineMiddleware)
+
+    @slow_app.get('/slow')
+    async def slow():
+        await asyncio.sleep(5)
+
+    return slow_app
+
+
+def test_request_past_deadline_gets_504(slow_app):
+    client = TestClient(slow_app)
+    started_at = time.perf_counter()
+
+    response = client.get('/slow', headers={'X-Request-Timeout': '0.05'})
+
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    assert response.json() == {'detail': 'Request timed out'}
+    assert time.perf_counter() - started_at < 1
+
+
+def test_route_timeout_overrides_default(monkeypatch):
+    default = 30.0
+    monkeypatch.setattr(deadline.settings, 'REQUEST_TIMEOUT_SECONDS', default)
+
+    assert deadline._request_timeout(_scope('/users/1')) == default
+    assert deadline._request_timeout(_scope('/users/export')) == 0
+    assert deadline._request_timeout(_scope('/users/bulk')) == 0
+
+
+def test_header_can_only_shorten_and_is_capped(monkeypatch):
+    cap = 10.0
+    monkeypatch.setattr(deadline.settings, 'REQUEST_TIMEOUT_SECONDS', 30.0)
+    monkeypatch.setattr(deadline.settings, 'REQUEST_TIMEOUT_MAX_SECONDS', cap)
+
+    def timeout(value):
+        return deadline._request_timeout(
+            _scope('/users/1', [(b'x-request-timeout', value)])
+        )
+
+    assert timeout(b'2.5') == 2.5  # noqa: PLR2004
+    assert timeout(b'120') == cap
+    assert timeout(b'bogus') == cap
+
+
+@pytest.mark.asyncio
+async def test_sqlite_statement_is_interrupted_at_deadline():
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    enforce_deadlines(engine)
+
+    async with engine.connect() as conn:
+        token = request_deadline.set(asyncio.get_running_loop().time() + 0.05)
+        started_at = time.perf_counter()
+        try:
+            with pytest.raises(DBAPIError, match='interrupted'):
+                await conn.execute(SLOW_QUERY)
+        finally:
+            request_deadline.reset(token)
+
+        assert time.perf_counter() - started_at < 1
+        assert await conn.scalar(text('SELECT 1')) == 1
+
+    await engine.dispose()
+
+
+def test_slow_query_is_cancelled_and_connection_released():
+    engine = create_async_engine(
+        'sqlite+aiosqlite:///:memory:',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool,
+    )
+    enforce_deadlines(engine)
+    slow_app = FastAPI()
+    slow_app.add_middleware(DeadlineMiddleware)
+
+    async def get_session():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    @slow_app.get('/slow')
+    async def slow(session: Annotated[AsyncSession, Depends(get_session)]):
+        return await session.scalar(SLOW_QUERY)
+
+    @slow_app.get('/fast')
+    async def fast(session: Annotated[AsyncSession, Depends(get_session)]):
+        return await session.scalar(text('SELECT 1'))
+
+    with TestClient(slow_app) as client:
+        started_at = time.perf_counter()
+        response = client.get('/slow', headers={'X-Request-Timeout': '0.1'})
+
+        assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+        assert time.perf_counter() - started_at < 1
+        assert client.get('/fast').json() == 1
+
+
+@pytest.mark.asyncio
+async def test_abandoned_shared_query_is_interrupted(tmp_path):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/db.sqlite')
+    enforce_deadlines(engine)
+    flight = SingleFlight()
+    tasks = []
+
+    async def query():
+        tasks.append(asyncio.current_task())
+        async with engine.connect() as conn:
+            return await conn.scalar(SLOW_QUERY)
+
+    # the shared task runs without a deadline, only its waiter has one
+    with pytest.raises(TimeoutError):
+        async with asyncio.timeout(0.05):
+            await flight.do('slow', query)
+    done, _ = await asyncio.wait(tasks, timeout=1)
+
+    assert done == set(tasks)
+    await engine.dispose()
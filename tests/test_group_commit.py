@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fastapi_zero.group_commit import GroupCommitWriter
+from fastapi_zero.models import User, table_registry
+
+
+@pytest_asyncio.fixture
+async def writer(tmp_path):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/db.sqlite')
+
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    writer = GroupCommitWriter(engine, window_seconds=0.05, max_batch=10)
+
+    yield writer
+
+    await writer.stop()
+    await engine.dispose()
+
+
+def _insert_user(username: str):
+    return (
+        insert(User)
+        .values(
+            username=username,
+            email=f'{username}@example.com',
+            password='secret',
+        )
+        .returning(User.id)
+    )
+
+
+@pytest.mark.asyncio
+async def test_group_commit_batches_concurrent_writes(writer):
+    names = ['alice', 'bob', 'carol', 'dave']
+
+    results = await asyncio.gather(
+        *(writer.execute(_insert_user(name)) for name in names)
+    )
+
+    async with writer.engine.connect() as conn:
+        count = await conn.scalar(select(func.count()).select_from(User))
+
+    assert [rows[0].id for rows in results] == [1, 2, 3, 4]
+    assert count == len(names)
+    assert writer.batches == 1
+    assert writer.writes == len(names)
+
+
+@pytest.mark.asyncio
+async def test_group_commit_isolates_row_errors(writer):
+    results = await asyncio.gather(
+        writer.execute(_insert_user('alice')),
+        writer.execute(_insert_user('alice')),
+        writer.execute(_insert_user('bob')),
+        return_exceptions=True,
+    )
+
+    async with writer.engine.connect() as conn:
+        usernames = (await conn.scalars(select(User.username))).all()
+
+    assert isinstance(results[1], IntegrityError)
+    assert sorted(usernames) == ['alice', 'bob']
+    assert writer.batches == 1
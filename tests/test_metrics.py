@@ -0,0 +1,60 @@
+from http import HTTPStatus
+
+from fastapi_zero.metrics import (
+    Counter,
+    Histogram,
+    Registry,
+    db_queries_per_request,
+    http_request_duration,
+    instrument_engine,
+)
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    counter = registry.register(Counter('hits_total', 'Hits.', ('path',)))
+    histogram = registry.register(
+        Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+    )
+
+    counter.inc(('/a',))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+
+    assert registry.render().splitlines() == [
+        '# HELP hits_total Hits.',
+        '# TYPE hits_total counter',
+        'hits_total{path="/a"} 1',
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        'latency_seconds_count 2',
+        'latency_seconds_sum 0.55',
+    ]
+
+
+def test_metrics_record_route_latency_and_queries(client, session, user):
+    instrument_engine(session.bind)
+    labels = ('GET', '/users/{user_id}', HTTPStatus.OK)
+    requests = http_request_duration.count(labels)
+    queries = db_queries_per_request.count(('/users/{user_id}',))
+
+    client.get(f'/users/{user.id}')
+
+    assert http_request_duration.count(labels) == requests + 1
+    assert db_queries_per_request.count(('/users/{user_id}',)) == queries + 1
+
+
+def test_metrics_endpoint(client):
+    client.post('/', json={'message': 'hi'})
+
+    response = client.get('/metrics')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/"' in (
+        response.text
+    )
+    assert 'password_hash_queue_depth' in response.text
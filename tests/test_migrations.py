@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+
+
+def test_migrations_match_the_models(tmp_path, monkeypatch):
+    monkeypatch.setenv(
+        'DATABASE_URL', f'sqlite+aiosqlite:///{tmp_path}/migrations.db'
+    )
+    # no ini file, so alembic leaves the test run's logging alone
+    config = Config()
+    config.set_main_option(
+        'script_location', str(Path(__file__).parents[1] / 'migrations')
+    )
+
+    command.upgrade(config, 'head')
+    command.check(config)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import pstats
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fastapi_zero import profiling
+from fastapi_zero.profiling import (
+    ProfilerMiddleware,
+    annotate_engine,
+    profile_span,
+    sign_profile_request,
+)
+
+
+@pytest.fixture
+def profiled_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling.settings, 'PROFILE_SECRET', 'secret')
+    monkeypatch.setattr(profiling.settings, 'PROFILE_DIRECTORY', tmp_path)
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    annotate_engine(engine)
+    profiled_app = FastAPI()
+    profiled_app.add_middleware(ProfilerMiddleware)
+
+    @profiled_app.get('/work')
+    async def work():
+        with profile_span('argon2', 'verify_password'):
+            await asyncio.sleep(0.02)
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+
+    return profiled_app
+
+
+def test_signature_round_trip():
+    assert profiling._valid_signature(
+        'secret', sign_profile_request('secret').encode()
+    )
+    assert not profiling._valid_signature(
+        'other', sign_profile_request('secret').encode()
+    )
+    assert not profiling._valid_signature(
+        'secret', sign_profile_request('secret', ttl_seconds=-1).encode()
+    )
+    assert not profiling._valid_signature('secret', b'garbage')
+
+
+def test_unsigned_request_is_not_profiled(profiled_app, tmp_path):
+    response = TestClient(profiled_app).get('/work')
+
+    assert response.status_code == HTTPStatus.OK
+    assert 'x-profile-id' not in response.headers
+    assert not list(tmp_path.iterdir())
+
+
+def test_signed_request_dumps_collapsed_stacks(profiled_app, tmp_path):
+    response = TestClient(profiled_app).get(
+        '/work', headers={'X-Profile': sign_profile_request('secret')}
+    )
+
+    profile_id = response.headers['x-profile-id']
+    folded = (tmp_path / f'{profile_id}.folded').read_text()
+    spans = json.loads((tmp_path / f'{profile_id}.spans.json').read_text())
+
+    assert '[argon2 verify_password]' in folded
+    assert all(
+        line.rsplit(' ', 1)[1].isdigit() for line in folded.splitlines()
+    )
+    assert [(span['kind'], span['label']) for span in spans] == [
+        ('argon2', 'verify_password'),
+        ('sql', 'SELECT 1'),
+    ]
+    assert spans[0]['duration_ms'] >= 20  # noqa: PLR2004
+
+
+def test_sampled_request_dumps_pstats(profiled_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling.settings, 'PROFILE_SECRET', None)
+    monkeypatch.setattr(profiling.settings, 'PROFILE_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(profiling.settings, 'PROFILE_FORMAT', 'pstats')
+
+    response = TestClient(profiled_app).get('/work')
+
+    profile_id = response.headers['x-profile-id']
+    stats = pstats.Stats(str(tmp_path / f'{profile_id}.prof'))
+    assert stats.total_calls > 0
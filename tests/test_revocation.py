@@ -0,0 +1,102 @@
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import delete, select
+
+from fastapi_zero.models import RefreshToken, RevokedToken
+from fastapi_zero.revocation import (
+    REFRESH_REUSE_WINDOW,
+    Denylist,
+    load_revocations,
+    purge_tokens,
+    revoke_token,
+    revoked_tokens,
+)
+
+
+def test_denylist_membership():
+    denylist = Denylist()
+
+    denylist.add('a', time.time() + 60)
+
+    assert 'a' in denylist
+    assert 'b' not in denylist
+
+
+def test_denylist_drops_expired_entries():
+    denylist = Denylist()
+    now = time.time()
+    denylist.add('old', now + 1)
+    denylist.add('new', now + 60)
+
+    denylist.purge(now + 2)
+
+    assert 'old' not in denylist
+    assert 'new' in denylist
+    assert len(denylist) == 1
+
+
+@pytest.mark.asyncio
+async def test_revocations_are_rebuilt_from_the_table(session):
+    now = time.time()
+    await revoke_token(session, 'live', now + 60)
+    session.add(
+        RevokedToken(
+            jti='expired',
+            expires_at=datetime.fromtimestamp(now - 60, tz=ZoneInfo('UTC')),
+        )
+    )
+    await session.commit()
+
+    await load_revocations(session.bind)
+
+    assert 'live' in revoked_tokens
+    assert 'expired' not in revoked_tokens
+    remaining = await session.scalars(select(RevokedToken.jti))
+    assert remaining.all() == ['live']
+    revoked_tokens.clear()
+
+
+@pytest.mark.asyncio
+async def test_purge_drops_stale_refresh_tokens(session, user):
+    now = datetime.now(tz=ZoneInfo('UTC'))
+    later = now + timedelta(days=1)
+    session.add_all([
+        RefreshToken(jti='live', user_id=user.id, expires_at=later),
+        RefreshToken(
+            jti='expired', user_id=user.id, expires_at=now - timedelta(days=1)
+        ),
+        RefreshToken(
+            jti='just_used', user_id=user.id, expires_at=later, used_at=now
+        ),
+        RefreshToken(
+            jti='long_used',
+            user_id=user.id,
+            expires_at=later,
+            used_at=now - REFRESH_REUSE_WINDOW,
+        ),
+    ])
+    await session.commit()
+
+    await purge_tokens(session, now)
+
+    remaining = await session.scalars(
+        select(RefreshToken.jti).order_by(RefreshToken.jti)
+    )
+    assert remaining.all() == ['just_used', 'live']
+
+
+@pytest.mark.asyncio
+async def test_purged_revocation_ids_are_not_reused(session):
+    now = time.time()
+    await revoke_token(session, 'expiring', now + 60)
+    purged_id = await session.scalar(select(RevokedToken.id))
+    await session.execute(delete(RevokedToken))
+    await session.commit()
+
+    await revoke_token(session, 'later', now + 60)
+
+    assert await session.scalar(select(RevokedToken.id)) > purged_id
+    revoked_tokens.clear()
@@ -1,8 +1,18 @@
+import asyncio
 from http import HTTPStatus
 
+import pytest
 from jwt import decode
 
-from fastapi_zero.security import create_acess_token
+from fastapi_zero import security
+from fastapi_zero.security import (
+    create_acess_token,
+    get_password_hash_async,
+    hash_stats,
+    invalidate_cached_user,
+    user_cache,
+    verify_password_async,
+)
 
 
 def test_jwt(settings):
@@ -26,6 +36,21 @@ def test_jwt_invalid_token(client, user):
     assert response.json() == {'detail': 'Could not validate credentials'}
 
 
+@pytest.mark.parametrize(
+    ('method', 'path'), [('get', '/users/'), ('post', '/auth/logout')]
+)
+def test_expired_token(client, user, monkeypatch, method, path):
+    monkeypatch.setattr(security.settings, 'ACCESS_TOKEN_EXPIRE_MINUTES', -1)
+    token = create_acess_token({'sub': user.email})
+
+    response = client.request(
+        method, path, headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Could not validate credentials'}
+
+
 def test_non_user_token(client):
     response = client.post(
         '/auth/token',
@@ -58,3 +83,79 @@ def test_get_current_user_does_not_exists(client):
 
     assert response.status_code == HTTPStatus.UNAUTHORIZED
     assert response.json() == {'detail': 'Could not validate credentials'}
+
+
+@pytest.mark.asyncio
+async def test_password_hash_runs_on_executor():
+    completed = hash_stats.completed
+
+    hashes = await asyncio.gather(
+        get_password_hash_async('secret'),
+        get_password_hash_async('secret'),
+    )
+
+    assert hashes[0] != hashes[1]
+    assert await verify_password_async('secret', hashes[0])
+    assert not await verify_password_async('wrong', hashes[1])
+    assert hash_stats.completed == completed + 4
+    assert hash_stats.in_flight == 0
+    assert hash_stats.wait_seconds_max >= 0
+
+
+def test_get_current_user_is_cached(client, user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/users/', headers=headers)
+    hits = user_cache.hits
+
+    response = client.get('/users/', headers=headers)
+
+    assert response.status_code == HTTPStatus.OK
+    assert user_cache.hits == hits + 1
+
+
+def test_cached_user_is_invalidated_on_update(client, user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/users/', headers=headers)
+
+    client.put(
+        f'/users/{user.id}',
+        headers=headers,
+        json={
+            'username': 'bob',
+            'email': 'bob@example.com',
+            'password': 'secret',
+        },
+    )
+    response = client.get('/users/', headers=headers)
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_cached_user_is_invalidated_on_delete(client, user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/users/', headers=headers)
+
+    client.delete(f'/users/{user.id}', headers=headers)
+    response = client.get('/users/', headers=headers)
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_lookup_overtaken_by_invalidation_is_not_cached(
+    client, user, token, monkeypatch
+):
+    fetch_user_row = security.fetch_user_row
+
+    async def fetch_then_invalidate(bind, criterion):
+        row = await fetch_user_row(bind, criterion)
+        invalidate_cached_user(user.email)
+        return row
+
+    monkeypatch.setattr(security, 'fetch_user_row', fetch_then_invalidate)
+
+    response = client.get(
+        '/users/', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert user_cache.get(user.email) is None
@@ -0,0 +1,23 @@
+from fastapi_zero.serialization import (
+    FastJSONResponse,
+    user_page_adapter,
+    user_row,
+)
+
+
+def test_page_dump_omits_unset_cursor():
+    page = {'users': [user_row('alice', 'alice@example.com', 1)]}
+
+    assert user_page_adapter.dump_json(page) == (
+        b'{"users":[{"username":"alice","email":"alice@example.com","id":1}]}'
+    )
+
+
+def test_response_passes_bytes_through():
+    assert FastJSONResponse(b'{"a":1}').body == b'{"a":1}'
+
+
+def test_response_encodes_objects_compactly():
+    assert FastJSONResponse({'name': 'zoë', 'ids': [1, 2]}).body == (
+        '{"name":"zoë","ids":[1,2]}'.encode()
+    )
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from fastapi_zero.deadline import request_deadline
+from fastapi_zero.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_query():
+    flight = SingleFlight()
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 'row'
+
+    results = await asyncio.gather(
+        *(flight.do('key', query) for _ in range(5))
+    )
+
+    assert results == ['row'] * 5
+    assert calls == 1
+    assert flight.shared == 4  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_others():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def query():
+        await release.wait()
+        return 'row'
+
+    first = asyncio.create_task(flight.do('key', query))
+    second = asyncio.create_task(flight.do('key', query))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == 'row'
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_query_is_cancelled_when_every_waiter_leaves():
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def query():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiter = asyncio.create_task(flight.do('key', query))
+    await asyncio.sleep(0)
+    waiter.cancel()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    async def fresh_query():
+        return 'row'
+
+    assert await flight.do('key', fresh_query) == 'row'
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def query():
+        await asyncio.sleep(0)
+        raise RuntimeError('boom')
+
+    results = await asyncio.gather(
+        flight.do('key', query),
+        flight.do('key', query),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_shared_call_does_not_inherit_caller_deadline():
+    flight = SingleFlight()
+
+    async def query():
+        return request_deadline.get()
+
+    token = request_deadline.set(0.0)
+    try:
+        result = await flight.do('key', query)
+    finally:
+        request_deadline.reset(token)
+
+    assert result is None
@@ -0,0 +1,192 @@
+from collections import deque
+from datetime import datetime
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fastapi_zero.deadline import request_deadline
+from fastapi_zero.metrics import request_scope
+from fastapi_zero.models import User, table_registry
+from fastapi_zero.routers import admin
+from fastapi_zero.slow_queries import SlowQueryLog, redact, slow_queries
+
+
+def test_redact_keeps_only_types():
+    assert redact(('alice', 10)) == ['<str>', '<int>']
+    assert redact({'email': 'a@a.com'}) == {'email': '<str>'}
+    assert redact([('a', 1), ('b', 2)]) == {
+        'rows': 2,
+        'first': ['<str>', '<int>'],
+    }
+
+
+@pytest.mark.asyncio
+async def test_slow_query_is_recorded_with_plan(tmp_path):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/slow.db')
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+        await conn.execute(
+            insert(User),
+            [{'username': 'alice', 'email': 'a@a.com', 'password': 'x'}],
+        )
+
+    log = SlowQueryLog(threshold_ms=0, maxlen=3)
+    log.attach(engine)
+    token = request_scope.set({'path': '/users/'})
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(select(1))
+            await conn.execute(select(User).offset(10).limit(10))
+            await conn.execute(select(User).where(User.email == 'a@a.com'))
+            await conn.execute(select(User).where(User.email == 'b@b.com'))
+    finally:
+        request_scope.reset(token)
+    await log.dispose()
+    await engine.dispose()
+
+    assert len(log.entries) == 3  # noqa: PLR2004
+    paged, by_email, again = log.entries
+    assert any('SCAN users' in line for line in paged['plan'])
+    assert by_email['route'] == '/users/'
+    assert by_email['parameters'] == ['<str>']
+    assert 'a@a.com' not in str(by_email)
+    assert any('sqlite_autoindex_users' in line for line in by_email['plan'])
+    assert again['plan'] == by_email['plan']
+
+
+@pytest.mark.asyncio
+async def test_explain_does_not_borrow_from_the_engine_pool(tmp_path):
+    # a writer pool of one, held by the request that ran the slow query
+    engine = create_async_engine(
+        f'sqlite+aiosqlite:///{tmp_path}/slow.db',
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    log = SlowQueryLog(threshold_ms=0, maxlen=1)
+    log.attach(engine)
+    async with engine.connect() as conn:
+        await conn.execute(select(User).where(User.id == 1))
+        await log.drain()
+    await log.dispose()
+    await engine.dispose()
+
+    assert not log.entries[0]['plan'][0].startswith('EXPLAIN failed')
+
+
+@pytest.mark.asyncio
+async def test_failed_query_is_recorded_with_error(tmp_path):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/slow.db')
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    log = SlowQueryLog(threshold_ms=0, maxlen=1)
+    log.attach(engine)
+    async with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            await conn.execute(text('SELECT * FROM missing'))
+    await log.drain()
+    await log.dispose()
+    await engine.dispose()
+
+    (entry,) = log.entries
+    assert entry['statement'] == 'SELECT * FROM missing'
+    assert entry['error'] == 'OperationalError'
+    assert entry['duration_ms'] >= 0
+
+
+@pytest.mark.asyncio
+async def test_in_memory_engine_is_not_explained():
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    log = SlowQueryLog(threshold_ms=0, maxlen=1)
+    log.attach(engine, explain=False)
+    async with engine.connect() as conn:
+        await conn.execute(select(User).where(User.id == 1))
+    await log.drain()
+    await log.dispose()
+    await engine.dispose()
+
+    assert log.entries[0]['plan'] is None
+    assert not log._explain_engines
+
+
+@pytest.mark.asyncio
+async def test_explain_does_not_inherit_request_deadline(session):
+    log = SlowQueryLog(threshold_ms=0, maxlen=1)
+    deadlines = []
+
+    async def explain(engine, entry, parameters):
+        deadlines.append(request_deadline.get())
+
+    log._explain = explain
+    token = request_deadline.set(0.0)
+    try:
+        log._check(session.bind.engine, 'SELECT 1', (), 1.0)
+    finally:
+        request_deadline.reset(token)
+    await log.drain()
+
+    assert deadlines == [None]
+
+
+@pytest.mark.asyncio
+async def test_fast_queries_are_not_recorded(session):
+    log = SlowQueryLog(threshold_ms=60_000, maxlen=10)
+    log._check(session.bind.engine, 'SELECT 1', (), 1.0)
+
+    assert not log.entries
+
+
+def test_admin_route_hidden_without_token(client):
+    response = client.get('/admin/slow-queries')
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_admin_route_rejects_wrong_token(client, monkeypatch):
+    monkeypatch.setattr(admin.settings, 'ADMIN_TOKEN', 'admin')
+
+    response = client.get(
+        '/admin/slow-queries', headers={'X-Admin-Token': 'nope'}
+    )
+
+    assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+def test_admin_route_lists_slow_queries(client, monkeypatch):
+    monkeypatch.setattr(admin.settings, 'ADMIN_TOKEN', 'admin')
+    monkeypatch.setattr(slow_queries, 'entries', deque(maxlen=10))
+    slow_queries.entries.append({
+        'statement': 'SELECT * FROM users LIMIT ? OFFSET ?',
+        'parameters': ['<int>', '<int>'],
+        'duration_ms': 250.0,
+        'route': '/users/',
+        'plan': ['2 0 0 SCAN users'],
+        'recorded_at': datetime(2025, 5, 22),
+    })
+
+    response = client.get(
+        '/admin/slow-queries', headers={'X-Admin-Token': 'admin'}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['queries'] == [
+        {
+            'statement': 'SELECT * FROM users LIMIT ? OFFSET ?',
+            'parameters': ['<int>', '<int>'],
+            'duration_ms': 250.0,
+            'route': '/users/',
+            'plan': ['2 0 0 SCAN users'],
+            'error': None,
+            'recorded_at': '2025-05-22T00:00:00',
+        }
+    ]
@@ -1,6 +1,14 @@
+import asyncio
+import json
 from http import HTTPStatus
 
-from fastapi_zero.schemas import UserPublic
+import pytest
+from sqlalchemy import select, text
+
+from fastapi_zero.models import User, email_domain
+from fastapi_zero.routers import users as users_router
+from fastapi_zero.routers.users import insert_users_batch
+from fastapi_zero.schemas import UserList, UserPublic
 
 
 def test_create_user(client):
@@ -111,3 +119,620 @@ def test_delete_a_non_user(client, other_user, token):
 
     assert response.status_code == HTTPStatus.FORBIDDEN
     assert response.json() == {'detail': 'Not enough permissions'}
+
+
+def test_read_users_with_cursor(client, user, other_user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first_page = client.get('/users/?limit=1', headers=headers).json()
+    second_page = client.get(
+        f'/users/?limit=1&cursor={first_page["next_cursor"]}',
+        headers=headers,
+    ).json()
+    last_page = client.get(
+        f'/users/?limit=1&cursor={second_page["next_cursor"]}',
+        headers=headers,
+    ).json()
+
+    assert [u['id'] for u in first_page['users']] == [user.id]
+    assert [u['id'] for u in second_page['users']] == [other_user.id]
+    assert last_page == {'users': []}
+
+
+def test_read_users_cursor_ignores_offset(client, user, other_user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    first_page = client.get('/users/?limit=1', headers=headers).json()
+
+    response = client.get(
+        f'/users/?offset=5&cursor={first_page["next_cursor"]}',
+        headers=headers,
+    )
+
+    assert response.json()['users'][0]['id'] == other_user.id
+
+
+def test_read_users_invalid_cursor(client, user, token):
+    response = client.get(
+        '/users/?cursor=not-a-cursor',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid cursor'}
+
+
+def test_export_users_ndjson(client, user, other_user, token):
+    response = client.get(
+        '/users/export', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert rows == [
+        UserPublic.model_validate(user).model_dump(),
+        UserPublic.model_validate(other_user).model_dump(),
+    ]
+
+
+def test_export_users_csv(client, user, token):
+    response = client.get(
+        '/users/export?format=csv',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'].startswith('text/csv')
+    assert response.text.splitlines() == [
+        'username,email,id',
+        f'{user.username},{user.email},{user.id}',
+    ]
+
+
+def test_export_users_requires_auth(client):
+    response = client.get('/users/export')
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_create_users_bulk(client, user, token):
+    response = client.post(
+        '/users/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=[
+            {
+                'username': 'alice',
+                'email': 'alice@example.com',
+                'password': 'secret',
+            },
+            {
+                'username': user.username,
+                'email': 'new@example.com',
+                'password': 'secret',
+            },
+            {
+                'username': 'bob',
+                'email': 'alice@example.com',
+                'password': 'secret',
+            },
+            {
+                'username': 'carol',
+                'email': 'carol@example.com',
+                'password': 'secret',
+            },
+        ],
+    )
+
+    body = response.json()
+    assert response.status_code == HTTPStatus.OK
+    assert body['created'] == 2  # noqa: PLR2004
+    assert body['conflicts'] == 2  # noqa: PLR2004
+    assert body['rows_per_second'] > 0
+    assert [(r['status'], r['detail']) for r in body['results']] == [
+        ('created', None),
+        ('conflict', 'Username already exists'),
+        ('conflict', 'Email already exists'),
+        ('created', None),
+    ]
+
+    login = client.post(
+        '/auth/token',
+        data={'username': 'carol@example.com', 'password': 'secret'},
+    )
+    assert login.status_code == HTTPStatus.OK
+
+
+def _bulk_payload(count):
+    return [
+        {
+            'username': f'bulk{i}',
+            'email': f'bulk{i}@example.com',
+            'password': 'secret',
+        }
+        for i in range(count)
+    ]
+
+
+def test_create_users_bulk_too_many(client, token, settings):
+    user = {'username': 'a', 'email': 'a@example.com', 'password': 'secret'}
+
+    response = client.post(
+        '/users/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=[user] * (settings.BULK_MAX_ITEMS + 1),
+    )
+
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_create_users_bulk_requires_auth(client):
+    response = client.post('/users/bulk', json=_bulk_payload(1))
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_create_users_bulk_chunks_conflict_lookup(
+    client, user, token, statements, monkeypatch
+):
+    monkeypatch.setattr(users_router.settings, 'BATCH_LOOKUP_CHUNK_SIZE', 4)
+    payload = [*_bulk_payload(3), {**_bulk_payload(4)[3], 'email': user.email}]
+
+    response = client.post(
+        '/users/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=payload,
+    )
+
+    selects = [s for s in statements if ' IN (' in s]
+    assert len(selects) == 2  # noqa: PLR2004
+    assert response.json()['created'] == 3  # noqa: PLR2004
+    assert response.json()['results'][3]['detail'] == 'Email already exists'
+
+
+def test_create_users_bulk_bounds_hashing(client, token, monkeypatch):
+    running = peak = 0
+    hash_password = users_router.get_password_hash_async
+
+    async def counting_hash(password):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await hash_password(password)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(users_router, 'get_password_hash_async', counting_hash)
+    monkeypatch.setattr(users_router.settings, 'BULK_HASH_CONCURRENCY', 2)
+    monkeypatch.setattr(users_router.settings, 'BULK_INSERT_BATCH_SIZE', 3)
+
+    response = client.post(
+        '/users/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=_bulk_payload(7),
+    )
+
+    assert response.json()['created'] == 7  # noqa: PLR2004
+    assert peak == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_bulk_insert_falls_back_to_single_rows(session, user):
+    rows = [
+        {'username': 'dave', 'email': 'dave@example.com', 'password': 'x'},
+        {'username': user.username, 'email': 'e@example.com', 'password': 'x'},
+    ]
+
+    ids = await insert_users_batch(session, rows)
+
+    assert ids[0] is not None
+    assert ids[1] is None
+
+
+def test_create_user_conflicts(client, user):
+    username, email = user.username, user.email
+
+    username_taken = client.post(
+        '/users/',
+        json={
+            'username': username,
+            'email': 'new@example.com',
+            'password': 'secret',
+        },
+    )
+    email_taken = client.post(
+        '/users/',
+        json={'username': 'new', 'email': email, 'password': 'secret'},
+    )
+
+    assert username_taken.status_code == HTTPStatus.CONFLICT
+    assert username_taken.json() == {'detail': 'Username already exists'}
+    assert email_taken.status_code == HTTPStatus.CONFLICT
+    assert email_taken.json() == {'detail': 'Email already exists'}
+
+
+def test_create_user_runs_one_statement(client, statements):
+    client.post(
+        '/users/',
+        json={
+            'username': 'alice',
+            'email': 'alice@example.com',
+            'password': 'secret',
+        },
+    )
+
+    assert len(statements) == 1
+    assert statements[0].startswith('INSERT')
+
+
+def test_update_user_runs_one_statement(client, user, token, statements):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/users/', headers=headers)
+    statements.clear()
+
+    client.put(
+        f'/users/{user.id}',
+        headers=headers,
+        json={'username': 'bob', 'email': user.email, 'password': 'secret'},
+    )
+
+    assert len(statements) == 1
+    assert statements[0].startswith('UPDATE')
+
+
+def test_delete_user_runs_one_statement(client, user, token, statements):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/users/', headers=headers)
+    statements.clear()
+
+    client.delete(f'/users/{user.id}', headers=headers)
+
+    assert len(statements) == 1
+    assert statements[0].startswith('DELETE')
+
+
+def test_read_user_etag_not_modified(client, user):
+    response = client.get(f'/users/{user.id}')
+    etag = response.headers['etag']
+
+    cached = client.get(f'/users/{user.id}', headers={'If-None-Match': etag})
+
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+    assert cached.headers['etag'] == etag
+    assert not cached.content
+
+
+def test_read_users_etag_changes_with_page(client, user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    etag = client.get('/users/', headers=headers).headers['etag']
+
+    not_modified = client.get(
+        '/users/', headers={**headers, 'If-None-Match': etag}
+    )
+    client.post(
+        '/users/',
+        json={
+            'username': 'alice',
+            'email': 'alice@example.com',
+            'password': 'secret',
+        },
+    )
+    modified = client.get(
+        '/users/', headers={**headers, 'If-None-Match': etag}
+    )
+
+    assert not_modified.status_code == HTTPStatus.NOT_MODIFIED
+    assert modified.status_code == HTTPStatus.OK
+    assert modified.headers['etag'] != etag
+
+
+def test_update_user_if_match(client, user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    etag = client.get(f'/users/{user.id}').headers['etag']
+    payload = {'username': 'bob', 'email': 'bob@x.com', 'password': 'secret'}
+
+    response = client.put(
+        f'/users/{user.id}',
+        headers={**headers, 'If-Match': etag},
+        json=payload,
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['etag'] != etag
+
+
+def test_update_user_hashes_outside_the_writer_transaction(
+    client, writer_session, user, token, monkeypatch
+):
+    etag = client.get(f'/users/{user.id}').headers['etag']
+    hash_password = users_router.get_password_hash_async
+    writer_busy = []
+
+    async def spy(password):
+        writer_busy.append(writer_session.in_transaction())
+        return await hash_password(password)
+
+    monkeypatch.setattr(users_router, 'get_password_hash_async', spy)
+
+    response = client.put(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}', 'If-Match': etag},
+        json={'username': 'bob', 'email': 'bob@x.com', 'password': 'secret'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert writer_busy == [False]
+
+
+def test_update_user_if_match_stale(client, user, token):
+    headers = {'Authorization': f'Bearer {token}', 'If-Match': '"stale"'}
+    payload = {'username': 'bob', 'email': 'bob@x.com', 'password': 'secret'}
+
+    response = client.put(f'/users/{user.id}', headers=headers, json=payload)
+
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert response.json() == {'detail': 'Precondition failed'}
+
+
+def test_read_user_runs_one_statement(client, user, statements):
+    response = client.get(f'/users/{user.id}')
+
+    assert response.json() == UserPublic.model_validate(user).model_dump()
+    assert len(statements) == 1
+
+
+def test_read_users_batch(client, user, other_user, statements):
+    response = client.get(
+        f'/users/batch?ids={other_user.id}&ids=999&ids={user.id}'
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'users': [
+            UserPublic.model_validate(other_user).model_dump(),
+            UserPublic.model_validate(user).model_dump(),
+        ],
+        'missing': [999],
+    }
+    assert len(statements) == 1
+
+
+def test_read_users_batch_post_chunks(client, user, statements, monkeypatch):
+    monkeypatch.setattr(users_router.settings, 'BATCH_LOOKUP_CHUNK_SIZE', 2)
+
+    response = client.post('/users/batch', json={'ids': [1, 2, 3, 1]})
+
+    assert response.json()['missing'] == [2, 3]
+    assert [u['id'] for u in response.json()['users']] == [user.id]
+    assert len(statements) == 2  # noqa: PLR2004
+
+
+def test_read_users_batch_too_many(client, settings):
+    ids = list(range(settings.BATCH_LOOKUP_MAX_IDS + 1))
+
+    response = client.post('/users/batch', json={'ids': ids})
+
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.fixture
+def search_users(client, token):
+    client.post(
+        '/users/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=[
+            {
+                'username': 'alice',
+                'email': 'alice@example.com',
+                'password': 'x',
+            },
+            {
+                'username': 'alicia',
+                'email': 'alicia@other.org',
+                'password': 'x',
+            },
+            {'username': 'bob', 'email': 'bob@other.org', 'password': 'x'},
+        ],
+    )
+    token = client.post(
+        '/auth/token', data={'username': 'bob@other.org', 'password': 'x'}
+    ).json()['access_token']
+
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.mark.parametrize(
+    ('query', 'expected'),
+    [
+        ('username_prefix=ali', ['alice', 'alicia']),
+        ('email_domain=OTHER.org', ['alicia', 'bob']),
+        ('q=alic', ['alice', 'alicia']),
+        ('q=example', ['alice']),
+        ('username_prefix=ali&email_domain=other.org', ['alicia']),
+        ('q=!!!', []),
+    ],
+)
+def test_search_users(client, search_users, query, expected):
+    response = client.get(f'/users/search?{query}', headers=search_users)
+
+    assert response.status_code == HTTPStatus.OK
+    assert [u['username'] for u in response.json()['users']] == expected
+
+
+def test_search_users_cursor(client, search_users):
+    first = client.get(
+        '/users/search?username_prefix=ali&limit=1', headers=search_users
+    ).json()
+    second = client.get(
+        f'/users/search?username_prefix=ali&limit=1&cursor={first["next_cursor"]}',
+        headers=search_users,
+    ).json()
+
+    assert [u['username'] for u in first['users']] == ['alice']
+    assert [u['username'] for u in second['users']] == ['alicia']
+
+
+def test_search_users_requires_a_filter(client, search_users):
+    response = client.get('/users/search', headers=search_users)
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_search_users_tracks_updates(client, search_users):
+    bob = client.get('/users/search?q=bob', headers=search_users).json()
+    client.put(
+        f'/users/{bob["users"][0]["id"]}',
+        headers=search_users,
+        json={'username': 'robert', 'email': 'bob@other.org', 'password': 'x'},
+    )
+
+    old = client.get('/users/search?q=bob', headers=search_users)
+    new = client.get('/users/search?q=robert', headers=search_users)
+
+    assert [u['username'] for u in old.json()['users']] == ['robert']
+    assert [u['username'] for u in new.json()['users']] == ['robert']
+
+
+@pytest.mark.asyncio
+async def test_email_domain_search_uses_index(session):
+    statement = select(User.id).where(
+        email_domain(User.email) == 'example.com'
+    )
+    compiled = statement.compile(
+        dialect=session.bind.dialect, compile_kwargs={'literal_binds': True}
+    )
+
+    plan = await session.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))
+
+    assert 'ix_users_email_domain' in str(plan.all())
+
+
+def test_read_users_sql_budget(client, user, token, sql_budget):
+    with sql_budget(max_statements=2, max_ms=50):
+        response = client.get(
+            '/users/', headers={'Authorization': f'Bearer {token}'}
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_read_users_with_warm_user_cache_sql_budget(
+    client, user, token, sql_budget
+):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/users/', headers=headers)
+
+    with sql_budget(max_statements=1, max_ms=50):
+        client.get('/users/?limit=5', headers=headers)
+
+
+def test_search_users_sql_budget(client, user, token, sql_budget):
+    with sql_budget(max_statements=2, max_ms=50):
+        response = client.get(
+            '/users/search?username_prefix=te',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_sql_budget_reports_captured_statements(session, sql_budget):
+    async def two_queries():
+        with sql_budget(max_statements=1):
+            await session.scalar(select(User.id))
+            await session.scalar(select(User.email))
+
+    with pytest.raises(pytest.fail.Exception) as failure:
+        await two_queries()
+
+    message = str(failure.value)
+    assert 'SQL budget exceeded: 2 statements, budget is 1' in message
+    assert 'SELECT users.email' in message
+
+
+def _legacy_json(model) -> bytes:
+    # what response_model + JSONResponse used to send
+    return json.dumps(
+        model.model_dump(mode='json', exclude_unset=True),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(',', ':'),
+    ).encode()
+
+
+@pytest.mark.asyncio
+async def test_read_users_fast_path_matches_response_model(
+    client, session, token
+):
+    session.add(User(username='zoë', email='zoe@example.com', password='x'))
+    await session.commit()
+    users = (await session.scalars(select(User).order_by(User.id))).all()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    full_page = client.get('/users/?limit=2', headers=headers)
+    last_page = client.get('/users/?limit=3', headers=headers)
+
+    assert full_page.content == _legacy_json(
+        UserList(
+            users=users,
+            next_cursor=full_page.json()['next_cursor'],
+        )
+    )
+    assert last_page.content == _legacy_json(UserList(users=users))
+    assert full_page.headers['content-type'] == 'application/json'
+
+
+def test_read_user_fast_path_matches_response_model(client, user):
+    response = client.get(f'/users/{user.id}')
+
+    assert response.content == _legacy_json(UserPublic.model_validate(user))
+    assert 'password' not in response.text
+
+
+def test_create_users_bulk_hashes_outside_the_writer_transaction(
+    client, writer_session, token, monkeypatch
+):
+    hash_password = users_router.get_password_hash_async
+    writer_busy = []
+
+    async def spy(password):
+        writer_busy.append(writer_session.in_transaction())
+        return await hash_password(password)
+
+    monkeypatch.setattr(users_router, 'get_password_hash_async', spy)
+
+    response = client.post(
+        '/users/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=_bulk_payload(2),
+    )
+
+    assert response.json()['created'] == 2  # noqa: PLR2004
+    assert writer_busy == [False, False]
+
+
+@pytest.mark.asyncio
+async def test_read_user_does_not_join_a_lookup_from_before_a_write(
+    session, user, monkeypatch
+):
+    release = asyncio.Event()
+    fetches = 0
+
+    async def slow_fetch(bind, criterion):
+        nonlocal fetches
+        fetches += 1
+        await release.wait()
+        return user
+
+    monkeypatch.setattr(users_router, 'fetch_user_row', slow_fetch)
+
+    before = asyncio.create_task(users_router.read_user(user.id, session))
+    await asyncio.sleep(0)
+    users_router.invalidate_user_row(user.id)
+    after = asyncio.create_task(users_router.read_user(user.id, session))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(before, after)
+
+    assert fetches == 2  # noqa: PLR2004